@@ -3,8 +3,12 @@
 ПОМОЩИ collections.abc
 """
 
+import bisect
 import collections.abc
-from typing import Iterable, Any, Sequence, Protocol
+import operator
+import random
+import time
+from typing import Iterable, Iterator, Any, Sequence, Protocol, overload
 
 
 class Comparable(Protocol):
@@ -19,7 +23,22 @@ class Comparable(Protocol):
 BaseMapping = collections.abc.Mapping[Comparable, Any]
 
 
+def isSorted(items: Sequence[Any], strict: bool = False) -> bool:
+    """One linear pass: is items in (strictly) ascending order?"""
+    compare = operator.lt if strict else operator.le
+    return all(map(compare, items, items[1:]))
+
+
 class Lookup(BaseMapping):
+    """An immutable mapping kept as two parallel lists sorted by key.
+
+    Lookups bisect keyList, so they take O(log n) and need only <, and
+    the keys come out in order: irange() walks a key range, floor() and
+    ceiling() find the nearest keys, rank() and select() convert between
+    keys and positions.  As in a dict, the last value given for a key
+    wins.
+    """
+
     @overload
     def __init__(
         self,
@@ -37,12 +56,225 @@ class Lookup(BaseMapping):
                 tuple[Comparable, Any]]
                 | BaseMapping | None = None
     ) -> None:
-        sortedPairs: Sequence[tuple[Comparable, Any]]
-        if isinstance(source, Sequence):
-            sortedPairs = sorted(source)
-        elif isinstance(source, collections.abc.Mapping):
-            sortedPairs = sorted(source.items())
+        if isinstance(source, Lookup):
+            self.keyList = list(source.keyList)
+            self.valueList = list(source.valueList)
+            return
+        pairs: Sequence[tuple[Comparable, Any]]
+        if isinstance(source, collections.abc.Mapping):
+            pairs = list(source.items())
+        elif source is not None:
+            pairs = list(source)
         else:
-            sortedPairs = []
-        self.keyList = [p[0] for p in sortedPairs]
-        self.valueList = [p[1] for p in sortedPairs]
+            pairs = []
+        keyList = [p[0] for p in pairs]
+        if isSorted(keyList, strict=True):
+            # Already in order without repeats: no sort, no merging.
+            self.keyList = keyList
+            self.valueList = [p[1] for p in pairs]
+            return
+        sortedPairs: Sequence[tuple[Comparable, Any]] = (
+            pairs if isSorted(keyList)
+            else sorted(pairs, key=operator.itemgetter(0))
+        )
+        # The sort is stable, so of equal keys the last one given wins.
+        self.keyList = []
+        self.valueList = []
+        for key, value in sortedPairs:
+            if self.keyList and self.keyList[-1] == key:
+                self.valueList[-1] = value
+            else:
+                self.keyList.append(key)
+                self.valueList.append(value)
+
+    def index(self, key: Comparable) -> int:
+        """Position of key in keyList; KeyError if it is not there."""
+        i = bisect.bisect_left(self.keyList, key)
+        if i != len(self.keyList) and self.keyList[i] == key:
+            return i
+        raise KeyError(key)
+
+    def __getitem__(self, key: Comparable) -> Any:
+        return self.valueList[self.index(key)]
+
+    def __contains__(self, key: object) -> bool:
+        i = bisect.bisect_left(self.keyList, key)
+        return i != len(self.keyList) and self.keyList[i] == key
+
+    def __iter__(self) -> Iterator[Comparable]:
+        return iter(self.keyList)
+
+    def __len__(self) -> int:
+        return len(self.keyList)
+
+    def __repr__(self) -> str:
+        pairs = ", ".join(
+            f"{k!r}: {v!r}" for k, v in zip(self.keyList, self.valueList)
+        )
+        return f"{type(self).__name__}({{{pairs}}})"
+
+    def bounds(
+            self, lo: Comparable | None, hi: Comparable | None,
+            inclusive: tuple[bool, bool] = (True, True),
+    ) -> range:
+        """Positions of the keys between lo and hi; None is unbounded."""
+        start, stop = 0, len(self.keyList)
+        if lo is not None:
+            side = bisect.bisect_left if inclusive[0] else bisect.bisect_right
+            start = side(self.keyList, lo)
+        if hi is not None:
+            side = bisect.bisect_right if inclusive[1] else bisect.bisect_left
+            stop = side(self.keyList, hi, start)
+        return range(start, max(start, stop))
+
+    def irange(
+            self, lo: Comparable | None = None, hi: Comparable | None = None,
+            inclusive: tuple[bool, bool] = (True, True), reverse: bool = False,
+    ) -> Iterator[Comparable]:
+        """The keys from lo to hi in order (or reversed), lazily."""
+        positions = self.bounds(lo, hi, inclusive)
+        return map(
+            self.keyList.__getitem__,
+            reversed(positions) if reverse else positions,
+        )
+
+    def irangeItems(
+            self, lo: Comparable | None = None, hi: Comparable | None = None,
+            inclusive: tuple[bool, bool] = (True, True),
+    ) -> Iterator[tuple[Comparable, Any]]:
+        """(key, value) pairs from lo to hi, lazily."""
+        positions = self.bounds(lo, hi, inclusive)
+        return zip(
+            map(self.keyList.__getitem__, positions),
+            map(self.valueList.__getitem__, positions),
+        )
+
+    def floor(self, key: Comparable) -> Comparable:
+        """The greatest key <= key; KeyError if there is none."""
+        i = bisect.bisect_right(self.keyList, key)
+        if i == 0:
+            raise KeyError(key)
+        return self.keyList[i - 1]
+
+    def ceiling(self, key: Comparable) -> Comparable:
+        """The least key >= key; KeyError if there is none."""
+        i = bisect.bisect_left(self.keyList, key)
+        if i == len(self.keyList):
+            raise KeyError(key)
+        return self.keyList[i]
+
+    def rank(self, key: Comparable) -> int:
+        """How many keys are less than key."""
+        return bisect.bisect_left(self.keyList, key)
+
+    def select(self, rank: int) -> Comparable:
+        """The key of the given rank (negative counts from the end)."""
+        return self.keyList[rank]
+
+    def get_many(
+            self, keys: Iterable[Comparable], default: Any = None,
+    ) -> list[Any]:
+        """[self.get(key, default) for key in keys], faster in bulk.
+
+        The keys are visited in ascending order (sorted first unless
+        they already are), each search starting where the previous one
+        ended, so the walk only ever moves forward through keyList.
+        """
+        queries = list(keys)
+        if isSorted(queries):
+            order: Iterable[int] = range(len(queries))
+        else:
+            order = sorted(range(len(queries)), key=queries.__getitem__)
+        keyList, valueList = self.keyList, self.valueList
+        size = len(keyList)
+        result = [default] * len(queries)
+        i = 0
+        for n in order:
+            key = queries[n]
+            i = bisect.bisect_left(keyList, key, i)
+            if i != size and keyList[i] == key:
+                result[n] = valueList[i]
+        return result
+
+
+def benchmark(
+        size: int = 1_000_000, points: int = 200_000, ranges: int = 200,
+        width: int = 1_000,
+) -> None:
+    """Lookup against a dict plus sorted() on a mix of point lookups and
+    range queries of about width keys.
+
+    The 10M key run is ``benchmark(10_000_000)``; building that takes a
+    few GB of memory, hence the smaller default.
+    """
+    generator = random.Random(42)
+    keys = generator.sample(range(size * 4), size)
+    pairs = [(key, key * 2) for key in keys]
+    queries = [generator.randrange(size * 4) for _ in range(points)]
+    spans = [
+        (lo, lo + width * 4)
+        for lo in (generator.randrange(size * 4) for _ in range(ranges))
+    ]
+
+    start = time.perf_counter()
+    lookup = Lookup(pairs)
+    build = time.perf_counter() - start
+    inOrder = sorted(pairs)
+    start = time.perf_counter()
+    Lookup(inOrder)
+    presorted = time.perf_counter() - start
+    start = time.perf_counter()
+    table = dict(pairs)
+    dictBuild = time.perf_counter() - start
+    print(f"build {size}: Lookup {build:.2f}s "
+          f"(presorted {presorted:.2f}s), dict {dictBuild:.2f}s")
+
+    start = time.perf_counter()
+    single = [lookup.get(key) for key in queries]
+    pointTime = time.perf_counter() - start
+    start = time.perf_counter()
+    many = lookup.get_many(queries)
+    manyTime = time.perf_counter() - start
+    start = time.perf_counter()
+    expected = [table.get(key) for key in queries]
+    dictTime = time.perf_counter() - start
+    assert single == many == expected
+    print(f"{points} points: Lookup.get {pointTime:.2f}s, "
+          f"get_many {manyTime:.2f}s, dict {dictTime:.2f}s")
+
+    start = time.perf_counter()
+    found = [list(lookup.irangeItems(lo, hi)) for lo, hi in spans]
+    rangeTime = time.perf_counter() - start
+    start = time.perf_counter()
+    scanned = [
+        sorted((k, v) for k, v in table.items() if lo <= k <= hi)
+        for lo, hi in spans
+    ]
+    dictRange = time.perf_counter() - start
+    assert found == scanned
+    print(f"{ranges} ranges: Lookup.irange {rangeTime:.3f}s, "
+          f"dict scan + sorted() {dictRange:.2f}s")
+
+    start = time.perf_counter()
+    for n, key in enumerate(queries):
+        if n % 1000 == 0:
+            lo, hi = spans[n // 1000 % ranges]
+            list(lookup.irange(lo, hi))
+        else:
+            lookup.get(key)
+    mixed = time.perf_counter() - start
+    start = time.perf_counter()
+    ordered = sorted(table)
+    for n, key in enumerate(queries):
+        if n % 1000 == 0:
+            lo, hi = spans[n // 1000 % ranges]
+            ordered[bisect.bisect_left(ordered, lo):bisect.bisect_right(ordered, hi)]
+        else:
+            table.get(key)
+    dictMixed = time.perf_counter() - start
+    print(f"mixed 999:1 points to ranges: Lookup {mixed:.2f}s, "
+          f"dict + one sorted() of the keys {dictMixed:.2f}s")
+
+
+if __name__ == "__main__":
+    benchmark()
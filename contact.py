@@ -3,28 +3,277 @@
 МНОЖЕСТВЕННОЕ НАСЛЕДОВАНИЕ, ПРОТОКОЛЫ
 """
 
-from typing import Protocol, Any
+from array import array
+import bisect
+import collections
+import csv
+import heapq
+import io
+import itertools
+import json
+from pathlib import Path
+import random
+import time
+from typing import Protocol, Any, Iterable, Iterator, NamedTuple, SupportsIndex
+import weakref
+import zlib
+
+
+def scanLongestKey(names: dict[str, int]) -> str | None:
+    "In effect, max(self, key=len), but less obscure"
+    longest = None
+    for key in names:
+        if longest is None or len(key) > len(longest):
+            longest = key
+
+    return longest
 
 
 class LongNameDict(dict[str, int]):
+    """A dict that keeps its keys bucketed by length as they come and go.
+
+    Each bucket keeps its keys in insertion order, so longestKey() is the
+    first key of the longest bucket, as the scan in scanLongestKey()
+    finds it.  A bucket emptied by a deletion is dropped at once; its
+    length stays in the sorted list of lengths until it is next passed
+    over, which keeps deletions O(1).
+    """
+
+    def __init__(self, *args: Any, **kwargs: int) -> None:
+        super().__init__()
+        self._buckets: dict[int, dict[str, None]] = {}
+        self._lengths: list[int] = []
+        self.update(*args, **kwargs)
+
+    def _track(self, key: str) -> None:
+        length = len(key)
+        bucket = self._buckets.get(length)
+        if bucket is None:
+            bucket = self._buckets[length] = {}
+            i = bisect.bisect_left(self._lengths, length)
+            if i == len(self._lengths) or self._lengths[i] != length:
+                self._lengths.insert(i, length)
+        bucket[key] = None
+
+    def _untrack(self, key: str) -> None:
+        bucket = self._buckets[len(key)]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[len(key)]
+
+    def __setitem__(self, key: str, value: int) -> None:
+        if key not in self:
+            self._track(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        self._untrack(key)
+
+    def pop(self, key: str, *default: Any) -> Any:  # type: ignore[override]
+        if key in self:
+            self._untrack(key)
+        return super().pop(key, *default)
+
+    def popitem(self) -> tuple[str, int]:
+        key, value = super().popitem()
+        self._untrack(key)
+        return key, value
+
+    def setdefault(self, key: str, default: Any = None) -> Any:  # type: ignore[override]
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args: Any, **kwargs: int) -> None:  # type: ignore[override]
+        if args:
+            (other,) = args
+            if hasattr(other, "keys"):
+                for key in other.keys():
+                    self[key] = other[key]
+            else:
+                for key, value in other:
+                    self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def __ior__(self, other: Any) -> "LongNameDict":  # type: ignore[override]
+        self.update(other)
+        return self
+
+    def clear(self) -> None:
+        super().clear()
+        self._buckets.clear()
+        self._lengths.clear()
+
+    def copy(self) -> "LongNameDict":
+        return type(self)(self)
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return type(self), (dict(self),)
+
     def longestKey(self) -> str | None:
-        "In effect, max(self, key=len), but less obscure"
-        longest = None
-        for key in self:
-            if longest is None or len(key) > len(longest):
-                longest = key
+        "In effect, max(self, key=len), in O(1) amortised"
+        lengths = self._lengths
+        while lengths and lengths[-1] not in self._buckets:
+            lengths.pop()
+        if not lengths:
+            return None
+        return next(iter(self._buckets[lengths[-1]]))
 
+    def top_k_longest(self, k: int) -> list[str]:
+        """The k longest keys, longest first; equally long keys in
+        insertion order."""
+        longest: list[str] = []
+        for length in reversed(self._lengths):
+            if len(longest) >= k:
+                break
+            bucket = self._buckets.get(length)
+            if bucket is not None:
+                longest.extend(itertools.islice(bucket, k - len(longest)))
         return longest
 
 
 class ContactList(list["Contact"]):
-    def search(self, name: str) -> list["Contact"]:
-        matchingContacts: list["Contact"] = []
-        for contact in self:
-            if name in contact.name:
-                matchingContacts.append(contact)
+    """A list of contacts with search indexes kept up to date on append.
+
+    Names go into a trigram index for substring search and a position
+    list sorted by name for prefix search; emails into an exact-match
+    index.  Contacts are indexed as they are when appended.  Any other
+    change to the list (insert, slicing, removal) drops the indexes,
+    and the next search rebuilds them.
+    """
+
+    #: Shorter queries have no trigram to look up and scan the list.
+    gramSize = 3
+
+    def __init__(self, contacts: Iterable["Contact"] = ()) -> None:
+        super().__init__()
+        self.reindex()
+        self.extend(contacts)
+
+    def reindex(self) -> None:
+        self._grams: collections.defaultdict[str, array[int]] = (
+            collections.defaultdict(lambda: array("L"))
+        )
+        self._emails: dict[str, list[int]] = {}
+        self._byName = array("L")
+        self._unsorted: list[int] = []
+        self._stale = False
+        for position, contact in enumerate(self):
+            self.indexContact(position, contact)
+
+    def indexContact(self, position: int, contact: "Contact") -> None:
+        name = contact.name
+        for gram in {name[i:i + self.gramSize] for i in range(len(name) - self.gramSize + 1)}:
+            self._grams[gram].append(position)
+        self._emails.setdefault(contact.email, []).append(position)
+        self._unsorted.append(position)
+
+    def fresh(self) -> None:
+        """Rebuild the indexes if the list changed behind them."""
+        if self._stale:
+            self.reindex()
+
+    def append(self, contact: "Contact") -> None:
+        super().append(contact)
+        if not self._stale:
+            self.indexContact(len(self) - 1, contact)
+
+    def extend(self, contacts: Iterable["Contact"]) -> None:
+        for contact in contacts:
+            self.append(contact)
+
+    def __iadd__(self, contacts: Iterable["Contact"]) -> "ContactList":  # type: ignore[override]
+        self.extend(contacts)
+        return self
+
+    def _changed(self) -> None:
+        self._stale = True
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        super().__setitem__(index, value)
+        self._changed()
+
+    def __delitem__(self, index: Any) -> None:
+        super().__delitem__(index)
+        self._changed()
+
+    def insert(self, index: SupportsIndex, contact: "Contact") -> None:
+        super().insert(index, contact)
+        self._changed()
 
-        return matchingContacts
+    def pop(self, index: SupportsIndex = -1) -> "Contact":
+        contact = super().pop(index)
+        self._changed()
+        return contact
+
+    def remove(self, contact: "Contact") -> None:
+        super().remove(contact)
+        self._changed()
+
+    def clear(self) -> None:
+        super().clear()
+        self.reindex()
+
+    def sort(self, *args: Any, **kwargs: Any) -> None:
+        super().sort(*args, **kwargs)
+        self._changed()
+
+    def reverse(self) -> None:
+        super().reverse()
+        self._changed()
+
+    def iterSearch(self, name: str) -> Iterator["Contact"]:
+        """Contacts whose name contains name, in list order, lazily.
+
+        Only the contacts listed under the query's rarest trigram are
+        checked; a query shorter than a trigram scans the list.
+        """
+        self.fresh()
+        if len(name) < self.gramSize:
+            return (contact for contact in self if name in contact.name)
+        postings = []
+        for i in range(len(name) - self.gramSize + 1):
+            posting = self._grams.get(name[i:i + self.gramSize])
+            if posting is None:
+                return iter(())
+            postings.append(posting)
+        candidates = min(postings, key=len)
+        return (
+            contact for contact in map(self.__getitem__, candidates)
+            if name in contact.name
+        )
+
+    def search(self, name: str, limit: int | None = None) -> list["Contact"]:
+        return list(itertools.islice(self.iterSearch(name), limit))
+
+    def nameOf(self, position: int) -> str:
+        return self[position].name
+
+    def iterPrefix(self, prefix: str) -> Iterator["Contact"]:
+        """Contacts whose name starts with prefix, in name order, lazily."""
+        self.fresh()
+        if self._unsorted:
+            self._unsorted.sort(key=self.nameOf)
+            # Two sorted runs: the sort merges them in linear time.
+            self._byName = array(
+                "L", sorted(itertools.chain(self._byName, self._unsorted), key=self.nameOf)
+            )
+            self._unsorted = []
+        start = bisect.bisect_left(self._byName, prefix, key=self.nameOf)
+        return itertools.takewhile(
+            lambda contact: contact.name.startswith(prefix),
+            map(self.__getitem__, map(self._byName.__getitem__, range(start, len(self._byName)))),
+        )
+
+    def startingWith(self, prefix: str, limit: int | None = 10) -> list["Contact"]:
+        """Autocomplete: the first limit contacts by name with prefix."""
+        return list(itertools.islice(self.iterPrefix(prefix), limit))
+
+    def findEmail(self, email: str) -> list["Contact"]:
+        self.fresh()
+        return [self[position] for position in self._emails.get(email, ())]
 
 
 class AddressHolder:
@@ -84,6 +333,411 @@ class EmailableContact(Contact, MailSender):
     pass
 
 
+class WeakContactList:
+    """A registry that does not keep its contacts alive.
+
+    Contact.allContacts = WeakContactList() in a long-running service:
+    contacts drop out once nothing else refers to them.  Search scans
+    the live contacts; emails are indexed.
+    """
+
+    def __init__(self) -> None:
+        self._refs: dict[int, weakref.ref["Contact"]] = {}
+        self._emails: collections.defaultdict[str, set[int]] = (
+            collections.defaultdict(set)
+        )
+        self._serial = itertools.count()
+
+    def append(self, contact: "Contact") -> None:
+        serial = next(self._serial)
+        email = contact.email
+
+        def forget(_: Any, refs: Any = self._refs, emails: Any = self._emails) -> None:
+            refs.pop(serial, None)
+            serials = emails.get(email)
+            if serials is not None:
+                serials.discard(serial)
+                if not serials:
+                    del emails[email]
+
+        self._refs[serial] = weakref.ref(contact, forget)
+        self._emails[email].add(serial)
+
+    def __iter__(self) -> Iterator["Contact"]:
+        for ref in list(self._refs.values()):
+            if (contact := ref()) is not None:
+                yield contact
+
+    def __len__(self) -> int:
+        return len(self._refs)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)!r})"
+
+    def search(self, name: str, limit: int | None = None) -> list["Contact"]:
+        return list(itertools.islice(
+            (contact for contact in self if name in contact.name), limit
+        ))
+
+    def findEmail(self, email: str) -> list["Contact"]:
+        refs = (self._refs.get(serial) for serial in self._emails.get(email, ()))
+        return [contact for ref in refs if ref and (contact := ref()) is not None]
+
+
+class ShardedContactList:
+    """A registry split by email hash over several ContactLists.
+
+    Each shard has its own indexes, so a change that makes one stale
+    rebuilds only that shard, and dropShard() lets a service release a
+    part of the registry at once.
+    """
+
+    def __init__(self, shards: int = 16) -> None:
+        self.shards = [ContactList() for _ in range(shards)]
+
+    def shardOf(self, email: str) -> ContactList:
+        return self.shards[zlib.crc32(email.encode("utf-8")) % len(self.shards)]
+
+    def append(self, contact: "Contact") -> None:
+        self.shardOf(contact.email).append(contact)
+
+    def dropShard(self, index: int) -> None:
+        self.shards[index].clear()
+
+    def __iter__(self) -> Iterator["Contact"]:
+        return itertools.chain.from_iterable(self.shards)
+
+    def __len__(self) -> int:
+        return sum(map(len, self.shards))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)!r})"
+
+    def iterSearch(self, name: str) -> Iterator["Contact"]:
+        return itertools.chain.from_iterable(
+            shard.iterSearch(name) for shard in self.shards
+        )
+
+    def search(self, name: str, limit: int | None = None) -> list["Contact"]:
+        return list(itertools.islice(self.iterSearch(name), limit))
+
+    def startingWith(self, prefix: str, limit: int | None = 10) -> list["Contact"]:
+        merged = heapq.merge(
+            *(shard.iterPrefix(prefix) for shard in self.shards),
+            key=lambda contact: contact.name,
+        )
+        return list(itertools.islice(merged, limit))
+
+    def findEmail(self, email: str) -> list["Contact"]:
+        return self.shardOf(email).findEmail(email)
+
+
+class LoadReport(NamedTuple):
+    added: int
+    updated: int
+    skipped: int
+
+
+class ContactView:
+    """One row of a ContactStore, read through to its columns."""
+
+    __slots__ = ("store", "row")
+
+    def __init__(self, store: "ContactStore", row: int) -> None:
+        self.store = store
+        self.row = row
+
+    def __getattr__(self, field: str) -> Any:
+        try:
+            column = self.store.columns[field]
+        except KeyError:
+            raise AttributeError(field) from None
+        return column[self.row]
+
+    @property
+    def kind(self) -> str:
+        return self.store.kindNames[self.store.kinds[self.row]]
+
+    def __repr__(self) -> str:
+        return f"{self.kind}View({self.name!r}, {self.email!r})"
+
+
+class ContactStore:
+    """Contacts kept column by column instead of one object each.
+
+    load() streams CSV or JSON lines straight into the columns, without
+    constructing Contact objects (and so without the cooperative
+    __init__ chain or the allContacts registry).  Rows are deduplicated
+    on their normalised email, which maps to its row (the key is the
+    same string the email column holds); a row seen again is updated in
+    place.  contact() builds a real Contact for
+    one row when needed; dump() writes the store back out in chunks.
+    """
+
+    __slots__ = ("columns", "kinds", "kindNames", "_byEmail")
+
+    fields = ("name", "email", "phone", "street", "city", "state", "code")
+
+    def __init__(self) -> None:
+        self.columns: dict[str, list[str]] = {field: [] for field in self.fields}
+        self.kinds = array("B")
+        self.kindNames: list[str] = ["Contact"]
+        self._byEmail: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, row: int) -> ContactView:
+        if not -len(self) <= row < len(self):
+            raise IndexError(row)
+        return ContactView(self, row % len(self))
+
+    def __iter__(self) -> Iterator[ContactView]:
+        return map(self.__getitem__, range(len(self)))
+
+    @staticmethod
+    def normalise(email: str) -> str:
+        return email.strip().lower()
+
+    def find(self, email: str) -> int | None:
+        """The row holding email, if any."""
+        return self._byEmail.get(self.normalise(email))
+
+    def kindCode(self, kind: str) -> int:
+        try:
+            return self.kindNames.index(kind)
+        except ValueError:
+            self.kindNames.append(kind)
+            return len(self.kindNames) - 1
+
+    def add(self, record: dict[str, Any]) -> bool:
+        """Add record, or update the row with its email; True if added."""
+        email = self.normalise(record.get("email") or "")
+        row = self.find(email) if email else None
+        if row is not None:
+            for field in self.fields:
+                if field in record and field != "email":
+                    self.columns[field][row] = record[field] or ""
+            if record.get("kind"):
+                self.kinds[row] = self.kindCode(record["kind"])
+            return False
+        kind = self.kindCode(record.get("kind") or "Contact")
+        row = len(self)
+        for field, column in self.columns.items():
+            column.append(email if field == "email" else record.get(field) or "")
+        self.kinds.append(kind)
+        if email:
+            self._byEmail[email] = row
+        return True
+
+    def load(self, path: Path, format: str | None = None) -> LoadReport:
+        """Stream records from a .csv (with a header row) or .jsonl file."""
+        format = format or ("csv" if path.suffix == ".csv" else "jsonl")
+        added = updated = skipped = 0
+        with path.open(newline="", encoding="utf-8") as source:
+            records: Iterable[dict[str, Any]]
+            if format == "csv":
+                records = csv.DictReader(source)
+            else:
+                records = (json.loads(line) for line in source if line.strip())
+            for record in records:
+                if not record.get("name") and not record.get("email"):
+                    skipped += 1
+                elif self.add(record):
+                    added += 1
+                else:
+                    updated += 1
+        return LoadReport(added, updated, skipped)
+
+    def chunks(self, size: int) -> Iterator[list[dict[str, str]]]:
+        fields = ("kind",) + self.fields
+        for start in range(0, len(self), size):
+            rows = range(start, min(start + size, len(self)))
+            columns = [[self.kindNames[self.kinds[row]] for row in rows]] + [
+                self.columns[field][start:rows.stop] for field in self.fields
+            ]
+            yield [dict(zip(fields, values)) for values in zip(*columns)]
+
+    def dump(self, path: Path, format: str | None = None, chunkSize: int = 10_000) -> None:
+        """Write every row as CSV or JSON lines, chunkSize rows per write."""
+        format = format or ("csv" if path.suffix == ".csv" else "jsonl")
+        with path.open("w", newline="", encoding="utf-8") as target:
+            if format == "csv":
+                writer = csv.DictWriter(target, ("kind",) + self.fields)
+                writer.writeheader()
+            for chunk in self.chunks(chunkSize):
+                if format == "csv":
+                    buffer = io.StringIO()
+                    csv.DictWriter(buffer, ("kind",) + self.fields).writerows(chunk)
+                    target.write(buffer.getvalue())
+                else:
+                    target.write("".join(json.dumps(record) + "\n" for record in chunk))
+
+    def contact(self, row: int, register: bool = False) -> "Contact":
+        """Row as a Contact (or the subclass named by its kind), built
+        without running __init__; register adds it to allContacts."""
+        view = self[row]
+        cls = contactClasses().get(view.kind, Contact)
+        contact = cls.__new__(cls)
+        contact.name, contact.email = view.name, view.email
+        if issubclass(cls, Friend):
+            contact.phone = view.phone
+        if issubclass(cls, AddressHolder):
+            for field in ("street", "city", "state", "code"):
+                setattr(contact, field, getattr(view, field))
+        if register:
+            cls.allContacts.append(contact)
+        return contact
+
+
+def contactClasses() -> dict[str, type["Contact"]]:
+    """Contact and every subclass of it by name."""
+    classes = {}
+    pending: list[type[Contact]] = [Contact]
+    while pending:
+        cls = pending.pop()
+        classes[cls.__name__] = cls
+        pending.extend(cls.__subclasses__())
+    return classes
+
+
+def benchmarkLoad(directory: Path, contacts: int = 200_000) -> None:
+    """Bulk load and dump against constructing Contact objects, on a
+    generated JSON lines file with one email in ten repeated.
+
+    The multi-million run is ``benchmarkLoad(path, 5_000_000)``.
+    """
+    source = directory / "contacts.jsonl"
+    with source.open("w", encoding="utf-8") as target:
+        for n in range(contacts):
+            email = f"user{n % (contacts - contacts // 10)}@example.com"
+            target.write(json.dumps({
+                "kind": "Friend", "name": f"Name {n}", "email": email,
+                "phone": f"555-{n:07d}",
+            }) + "\n")
+
+    store = ContactStore()
+    start = time.perf_counter()
+    report = store.load(source)
+    loaded = time.perf_counter() - start
+
+    registry = Contact.allContacts
+    Contact.allContacts = ContactList()
+    start = time.perf_counter()
+    with source.open(encoding="utf-8") as records:
+        for line in records:
+            record = json.loads(line)
+            del record["kind"]
+            Friend(**record)
+    constructed = time.perf_counter() - start
+    Contact.allContacts = registry
+
+    start = time.perf_counter()
+    store.dump(directory / "contacts-out.csv")
+    dumped = time.perf_counter() - start
+    print(f"{contacts} records: ContactStore.load {loaded:.2f}s {report}, "
+          f"Friend(**record) {constructed:.2f}s, dump {dumped:.2f}s")
+    source.unlink()
+    (directory / "contacts-out.csv").unlink()
+
+
+def benchmarkLongest(keys: int = 20_000, queries: int = 200_000) -> None:
+    """LongNameDict against scanLongestKey() after every insert (the
+    scan being quadratic overall, keys is kept small) and on a
+    query-heavy mix with one delete per hundred queries."""
+    generator = random.Random(11)
+    words = [
+        "".join(generator.choices("abcdefghij", k=generator.randint(3, 40)))
+        for _ in range(keys)
+    ]
+
+    plain: dict[str, int] = {}
+    start = time.perf_counter()
+    for n, word in enumerate(words):
+        plain[word] = n
+        scanLongestKey(plain)
+    scan = time.perf_counter() - start
+    tracked = LongNameDict()
+    start = time.perf_counter()
+    for n, word in enumerate(words):
+        tracked[word] = n
+        tracked.longestKey()
+    incremental = time.perf_counter() - start
+    assert tracked.longestKey() == scanLongestKey(plain)
+    print(f"insert-heavy, {keys} inserts each followed by longestKey(): "
+          f"scan {scan:.2f}s, LongNameDict {incremental:.3f}s")
+
+    start = time.perf_counter()
+    remaining = list(tracked)
+    generator.shuffle(remaining)
+    for n in range(queries):
+        if n % 100 == 0 and remaining:
+            del tracked[remaining.pop()]
+        if n % 2:
+            tracked.top_k_longest(10)
+        else:
+            tracked.longestKey()
+    mixed = time.perf_counter() - start
+    sample = max(1, queries // 1000)
+    start = time.perf_counter()
+    for n in range(sample):
+        sorted(tracked, key=len, reverse=True)[:10]
+    sortedTime = (time.perf_counter() - start) * queries / sample
+    print(f"query-heavy, {queries} longestKey()/top_k_longest(10): "
+          f"LongNameDict {mixed:.3f}s, sorted() each time ~{sortedTime:.1f}s")
+
+
+def benchmark(contacts: int = 200_000, queries: int = 500) -> None:
+    """Queries/sec of the indexes against the linear name scan, on
+    generated contacts added to Contact.allContacts.
+
+    For a directory of millions, ``benchmark(5_000_000)``.
+    """
+    generator = random.Random(7)
+    syllables = ["an", "bel", "cor", "da", "ev", "fin", "gra", "hol", "is", "jo",
+                 "ka", "lin", "mar", "nor", "os", "pe", "qui", "ros", "sa", "tor"]
+
+    def word() -> str:
+        return "".join(generator.choices(syllables, k=generator.randint(2, 4))).title()
+
+    start = time.perf_counter()
+    for n in range(contacts):
+        Contact(f"{word()} {word()}", f"user{n}@example.com")
+    print(f"{contacts} contacts appended and indexed in "
+          f"{time.perf_counter() - start:.2f}s")
+
+    directory = Contact.allContacts
+    substrings = [word()[1:5] for _ in range(queries)]
+    prefixes = [word()[:4] for _ in range(queries)]
+    emails = [f"user{generator.randrange(contacts)}@example.com" for _ in range(queries)]
+
+    def rate(label: str, run: Any, items: list[str]) -> float:
+        start = time.perf_counter()
+        for item in items:
+            run(item)
+        perSecond = len(items) / (time.perf_counter() - start)
+        print(f"{label:<28} {perSecond:>12,.0f} queries/s")
+        return perSecond
+
+    start = time.perf_counter()
+    directory.startingWith("")
+    print(f"prefix index sorted in {time.perf_counter() - start:.2f}s")
+
+    scanned = substrings[: max(1, queries // 50)]
+    scan = rate("scan substring", lambda name: [c for c in list.__iter__(directory) if name in c.name], scanned)
+    index = rate("trigram substring", directory.search, substrings)
+    rate("trigram substring, limit 10", lambda name: directory.search(name, 10), substrings)
+    rate("prefix, limit 10", directory.startingWith, prefixes)
+    rate("scan email", lambda email: [c for c in list.__iter__(directory) if c.email == email], emails[:len(scanned)])
+    rate("email index", directory.findEmail, emails)
+    print(f"substring speedup x{index / scan:.0f}")
+
+
 e = EmailableContact("John B", "jog@gmail.com")
 print(Contact.allContacts)
 e.sendMail("Hello, test")
+
+
+if __name__ == "__main__":
+    benchmark()
+    benchmarkLongest()
@@ -2,6 +2,19 @@
 Данный пример демонстрирует принцип работы EXCEPTION и СОЗДАНИЯ СОБСТВЕННЫХ EXCEPTION
 """
 
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import pathlib
+import random
+import tempfile
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, NamedTuple
+
+
 class OutOfStock(Exception):
     pass
 
@@ -10,26 +23,354 @@ class InvalidItemType(Exception):
     pass
 
 
+class BatchError(Exception):
+    """A batch that was refused as a whole; failures holds
+    (line number, OutOfStock | InvalidItemType | ValueError) per bad line."""
+
+    def __init__(self, failures: list[tuple[int, Exception]]) -> None:
+        super().__init__(failures)
+        self.failures = failures
+
+    def __str__(self) -> str:
+        return "; ".join(
+            f"line {n}: {type(error).__name__}" for n, error in self.failures
+        )
+
+
 class ItemType:
     def __init__(self, name: str) -> None:
         self.name = name
-        self.on_band = 0 
+        self.on_band = 0
+
+
+class LockStats:
+    """How long one item type's lock was waited for and held."""
+
+    __slots__ = (
+        "acquisitions", "contended", "wait_total", "wait_max",
+        "hold_total", "hold_max",
+    )
+
+    def __init__(self) -> None:
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+
+    def waited(self, seconds: float, contended: bool) -> None:
+        self.acquisitions += 1
+        self.contended += contended
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    def held(self, seconds: float) -> None:
+        self.hold_total += seconds
+        self.hold_max = max(self.hold_max, seconds)
+
+    def __repr__(self) -> str:
+        return (
+            f"LockStats({self.acquisitions} acquisitions, "
+            f"{self.contended} contended, wait {self.wait_total:.6f}s "
+            f"(max {self.wait_max:.6f}s), hold {self.hold_total:.6f}s "
+            f"(max {self.hold_max:.6f}s))"
+        )
+
+
+class Reservation(NamedTuple):
+    id: int
+    lines: dict[str, int]
+
+
+class InventoryLog:
+    """Append-only journal of stock changes plus the latest snapshot.
+
+    Every change is one JSON line in a journal-<first seq>.log segment.
+    With group_commit, appends only queue their line: a flusher thread
+    writes whatever queued up while its previous fsync ran (plus window
+    seconds more, if set) and fsyncs once for all of it, and wait()
+    returns once a line is on disk.  Without it, every append fsyncs on
+    its own.  A snapshot starts a new segment
+    and deletes the older ones, so a restart reads the snapshot and
+    replays only what came after it.
+    """
+
+    def __init__(
+            self, directory: str | os.PathLike[str],
+            group_commit: bool = True, window: float = 0.0,
+    ) -> None:
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.group_commit = group_commit
+        self.window = window
+        self.seq = 0
+        self.durable = 0
+        self.snapshot_seq = -1
+        self.fsyncs = 0
+        self._mutex = threading.Lock()
+        self._work = threading.Condition(self._mutex)
+        self._flushed = threading.Condition(self._mutex)
+        self._snapshotting = threading.Lock()
+        self._pending: list[bytes] = []
+        self._error: OSError | None = None
+        self._closed = False
+        self._file: Any = None
+        self._flusher: threading.Thread | None = None
+
+    @property
+    def snapshot_path(self) -> pathlib.Path:
+        return self.directory / "snapshot.json"
+
+    def segments(self) -> list[pathlib.Path]:
+        return sorted(self.directory.glob("journal-*.log"))
+
+    def sync_directory(self) -> None:
+        """fsync the directory so new and renamed files survive a crash."""
+        try:
+            descriptor = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(descriptor)
+        except OSError:
+            pass
+        finally:
+            os.close(descriptor)
+
+    def recover(self) -> tuple[dict[str, Any] | None, list[dict[str, Any]]]:
+        """The snapshot and the records after it; then open for appending.
+
+        A torn line at the end of a segment (a crash mid-write) ends
+        that segment's replay; it was never acknowledged.
+        """
+        snapshot = None
+        if self.snapshot_path.exists():
+            snapshot = json.loads(self.snapshot_path.read_text())
+        base = snapshot["seq"] if snapshot else 0
+        records = []
+        for segment in self.segments():
+            with segment.open("rb") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if record["seq"] > base:
+                        records.append(record)
+        self.seq = self.durable = max(
+            [base] + [record["seq"] for record in records]
+        )
+        self.snapshot_seq = snapshot["seq"] if snapshot else -1
+        self._open(self.seq + 1)
+        if self.group_commit:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="inventory-log", daemon=True,
+            )
+            self._flusher.start()
+        return snapshot, records
+
+    def _open(self, start: int) -> None:
+        # A segment named after start can only hold a torn line: any whole
+        # record in it would have moved self.seq past start.
+        self._file = open(self.directory / f"journal-{start:012d}.log", "wb")
+        self.sync_directory()
+
+    def append(self, record: dict[str, Any]) -> int:
+        """Queue (or, without group commit, write and fsync) record;
+        return its sequence number for wait()."""
+        with self._mutex:
+            # After a failed write the journal refuses further changes.
+            if self._error is not None:
+                raise self._error
+            self.seq += 1
+            record["seq"] = self.seq
+            line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+            if self.group_commit:
+                self._pending.append(line)
+                self._work.notify()
+            else:
+                try:
+                    self._file.write(line)
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except OSError as error:
+                    self._error = error
+                    raise
+                self.fsyncs += 1
+                self.durable = self.seq
+            return self.seq
+
+    def wait(self, seq: int) -> None:
+        """Block until every record up to seq is on disk."""
+        if seq <= self.durable:
+            return
+        with self._mutex:
+            while self.durable < seq:
+                if self._error is not None:
+                    raise self._error
+                self._flushed.wait()
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._mutex:
+                while not self._pending and not self._closed:
+                    self._work.wait()
+                if not self._pending:
+                    return
+            # Let the rest of the window's appends join this fsync.
+            time.sleep(self.window)
+            with self._mutex:
+                batch, self._pending = self._pending, []
+                last = self.seq
+                file = self._file
+            try:
+                file.write(b"".join(batch))
+                file.flush()
+                os.fsync(file.fileno())
+            except OSError as error:
+                with self._mutex:
+                    self._error = error
+                    self._flushed.notify_all()
+                return
+            with self._mutex:
+                self.durable = last
+                self.fsyncs += 1
+                self._flushed.notify_all()
+
+    def rotate(self) -> int:
+        """Make everything durable and start a new segment; the caller
+        keeps appends out meanwhile.  Returns the last seq before it."""
+        seq = self.seq
+        self.wait(seq)
+        with self._mutex:
+            self._file.close()
+            self._open(seq + 1)
+        return seq
+
+    def save_snapshot(self, state: dict[str, Any]) -> None:
+        """Atomically replace the snapshot, then drop the segments it covers."""
+        with self._snapshotting:
+            if state["seq"] <= self.snapshot_seq:
+                return
+            handle, name = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(handle, "w") as file:
+                    json.dump(state, file)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(name, self.snapshot_path)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.unlink(name)
+                raise
+            self.sync_directory()
+            self.snapshot_seq = state["seq"]
+            for segment in self.segments():
+                if int(segment.stem.split("-")[1]) <= state["seq"]:
+                    segment.unlink()
+
+    def close(self) -> None:
+        with self._mutex:
+            self._closed = True
+            self._work.notify()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self._file is not None:
+            self._file.close()
 
 
 class Inventory:
-    def __init__(self, stock: list[ItemType]) -> None:
-        pass
+    """Stock of several item types, each with a lock of its own.
+
+    Purchases of different item types never wait for each other.  With
+    stripes, item types share that many locks instead (reentrant, so
+    one thread may hold two item types on the same stripe).  With a
+    journal, the stock is restored from it and every change is journalled
+    before it is applied and on disk before the call that made it
+    returns (for purchare(), before unlock() returns); the wait for the
+    disk happens after the item locks are released, and a change whose
+    write fails is rolled back.  A snapshot is taken every
+    snapshot_every records.
+    """
+
+    def __init__(
+            self, stock: list[ItemType], stripes: int | None = None,
+            journal: InventoryLog | None = None, snapshot_every: int = 10_000,
+    ) -> None:
+        self.items = {item_type.name: item_type for item_type in stock}
+        if stripes is None:
+            self._locks = {name: threading.Lock() for name in self.items}
+        else:
+            shared = [threading.RLock() for _ in range(stripes)]
+            self._locks = {
+                name: shared[hash(name) % stripes] for name in self.items
+            }
+        self._owners: dict[str, int] = {}
+        self._acquired: dict[str, float] = {}
+        #: Item name -> (last seq, purchases) journalled by purchare()
+        #: under a lock that unlock() has not released yet.
+        self._unsynced: dict[str, tuple[int, int]] = {}
+        self.stats = {name: LockStats() for name in self.items}
+        self.reservations: dict[int, dict[str, int]] = {}
+        self._reservation_ids = itertools.count(1)
+        self.journal = journal
+        self.snapshot_every = snapshot_every
+        if journal is not None:
+            snapshot, entries = journal.recover()
+            self.restore(snapshot, entries)
+            if snapshot is None:
+                # The journal only holds changes: record what they apply to.
+                self.snapshot()
+
+    def item(self, item_type: ItemType) -> ItemType:
+        try:
+            return self.items[item_type.name]
+        except KeyError:
+            raise InvalidItemType(item_type) from None
 
     def lock(self, item_type: ItemType) -> None:
         """Context Entry.
         Lock the item type so nobody else can manipulate the
         iventory while we're working"""
-        pass
+        name = self.item(item_type).name
+        lock = self._locks[name]
+        start = time.perf_counter()
+        contended = not lock.acquire(blocking=False)
+        if contended:
+            lock.acquire()
+        acquired = time.perf_counter()
+        self.stats[name].waited(acquired - start, contended)
+        self._owners[name] = threading.get_ident()
+        self._acquired[name] = acquired
 
     def unlock(self, item_type: ItemType) -> None:
         """Context Exit.
         Unlock the item type."""
-        pass
+        name = self.item(item_type).name
+        if self._owners.get(name) != threading.get_ident():
+            raise ValueError(f"{name} is not locked by this thread")
+        self.stats[name].held(time.perf_counter() - self._acquired[name])
+        del self._owners[name]
+        unsynced = self._unsynced.pop(name, None)
+        self._locks[name].release()
+        if unsynced is not None:
+            seq, count = unsynced
+            self.durable(seq, [name], lambda: self.apply(
+                {"op": "put", "lines": {name: count}}
+            ))
+
+    @contextlib.contextmanager
+    def locked(self, item_type: ItemType) -> Iterator[ItemType]:
+        """with inventory.locked(item_type): ... lock() and unlock()."""
+        self.lock(item_type)
+        try:
+            yield self.items[item_type.name]
+        finally:
+            self.unlock(item_type)
+
+    def is_locked(self, name: str) -> bool:
+        return self._owners.get(name) == threading.get_ident()
 
     def purchare(self, item_type: ItemType) -> int:
         """If the item is not locked, raise a
@@ -41,10 +382,381 @@ class Inventory:
         If the item is available,
             subtract one item; return the number of items left.
         """
-        # Mocked results.
-        if item_type.name == "Widget":
+        if not self.is_locked(item_type.name):
+            raise ValueError(f"{item_type.name} is not locked")
+        stocked = self.item(item_type)
+        if stocked.on_band <= 0:
             raise OutOfStock(item_type)
-        elif item_type.name == "Gadget":
-            return 42
-        else:
-            raise InvalidItemType(item_type)
\ No newline at end of file
+        seq = self.change("take", {stocked.name: 1})
+        if seq:
+            _, count = self._unsynced.get(stocked.name, (0, 0))
+            self._unsynced[stocked.name] = (seq, count + 1)
+        return stocked.on_band
+
+    def purchase(self, item_type: ItemType) -> int:
+        """Lock, purchare and unlock in one call."""
+        with self.locked(item_type):
+            return self.purchare(item_type)
+
+    @contextlib.contextmanager
+    def locked_many(self, names: Iterable[str]) -> Iterator[None]:
+        """Lock several item types, always in name order so that two
+        batches can never deadlock on each other."""
+        with contextlib.ExitStack() as stack:
+            for name in sorted(set(names)):
+                stack.enter_context(self.locked(self.items[name]))
+            yield
+
+    def change(
+            self, op: str, lines: dict[str, int], reservation: int | None = None,
+    ) -> int:
+        """Journal a change, then apply it; the caller holds its items'
+        locks.  Returns the seq to hand to durable(), 0 without a journal.
+
+        If the journal refuses the record, nothing has changed yet.  The
+        caller waits for the seq only after unlocking, so one change's
+        fsync does not hold up the next change to the same items.
+        """
+        entry: dict[str, Any] = {"op": op, "lines": lines}
+        if reservation is not None:
+            entry["id"] = reservation
+        seq = 0 if self.journal is None else self.journal.append(dict(entry))
+        self.apply(entry)
+        return seq
+
+    def apply(self, entry: dict[str, Any]) -> None:
+        """Redo one journal record."""
+        op, lines, reservation = entry["op"], entry["lines"], entry.get("id")
+        if op == "take":
+            for name, quantity in lines.items():
+                self.items[name].on_band -= quantity
+            if reservation is not None:
+                self.reservations[reservation] = lines
+        elif op == "put":
+            for name, quantity in lines.items():
+                self.items[name].on_band += quantity
+            self.reservations.pop(reservation, None)
+        elif op == "confirm":
+            self.reservations.pop(reservation, None)
+        elif op == "hold":
+            # Only ever applied to undo a confirm that failed to reach disk.
+            self.reservations[reservation] = lines
+
+    def restore(
+            self, snapshot: dict[str, Any] | None, entries: list[dict[str, Any]],
+    ) -> None:
+        last = 0
+        if snapshot is not None:
+            for name, on_band in snapshot["on_band"].items():
+                if name in self.items:
+                    self.items[name].on_band = on_band
+            self.reservations = {
+                int(reservation): lines
+                for reservation, lines in snapshot["reservations"].items()
+            }
+            last = snapshot["last_reservation"]
+        for entry in entries:
+            self.apply(entry)
+            last = max(last, entry.get("id") or 0)
+        self._reservation_ids = itertools.count(last + 1)
+
+    def take(
+            self, lines: Iterable[tuple[ItemType, int]], reserve: bool = False,
+    ) -> tuple[dict[str, int], int | None]:
+        """Take every line out of stock or none of them.
+
+        Returns what is left of each item type and the reservation id;
+        raises BatchError naming each line that could not be served.
+        """
+        lines = list(lines)
+        failures: list[tuple[int, Exception]] = []
+        wanted: dict[str, int] = {}
+        for n, (item_type, quantity) in enumerate(lines):
+            if item_type.name not in self.items:
+                failures.append((n, InvalidItemType(item_type)))
+            elif quantity <= 0:
+                failures.append((n, ValueError(f"quantity {quantity}")))
+            else:
+                wanted[item_type.name] = wanted.get(item_type.name, 0) + quantity
+        with self.locked_many(wanted):
+            running: dict[str, int] = {}
+            for n, (item_type, quantity) in enumerate(lines):
+                if item_type.name not in wanted or quantity <= 0:
+                    continue
+                running[item_type.name] = running.get(item_type.name, 0) + quantity
+                if running[item_type.name] > self.items[item_type.name].on_band:
+                    failures.append((n, OutOfStock(item_type)))
+            if failures:
+                raise BatchError(sorted(failures, key=lambda failure: failure[0]))
+            reservation = next(self._reservation_ids) if reserve else None
+            seq = self.change("take", wanted, reservation)
+            left = {name: self.items[name].on_band for name in wanted}
+        self.durable(seq, wanted, lambda: self.apply(
+            {"op": "put", "lines": wanted, "id": reservation}
+        ))
+        return left, reservation
+
+    def purchase_many(self, lines: Iterable[tuple[ItemType, int]]) -> dict[str, int]:
+        """Purchase (item_type, quantity) lines atomically; return what is
+        left of each item type.  BatchError if any line fails."""
+        return self.take(lines)[0]
+
+    def reserve_many(self, lines: Iterable[tuple[ItemType, int]]) -> Reservation:
+        """Set (item_type, quantity) lines aside atomically until they are
+        confirm()ed or release()d.  BatchError if any line fails."""
+        left, reservation = self.take(lines, reserve=True)
+        assert reservation is not None
+        return Reservation(reservation, self.reservations[reservation])
+
+    def settle(self, reservation: Reservation, op: str) -> None:
+        with self.locked_many(reservation.lines):
+            lines = self.reservations.get(reservation.id)
+            if lines is None:
+                raise ValueError(f"no reservation {reservation.id}")
+            seq = self.change(op, lines, reservation.id)
+        # Undoing either op brings the reservation back; a release also
+        # takes its items out of stock again.
+        undo = {"op": "take" if op == "put" else "hold", "lines": lines,
+                "id": reservation.id}
+        self.durable(seq, lines, lambda: self.apply(undo))
+
+    def confirm(self, reservation: Reservation) -> None:
+        """Turn a reservation into a purchase."""
+        self.settle(reservation, "confirm")
+
+    def release(self, reservation: Reservation) -> None:
+        """Put a reservation back into stock."""
+        self.settle(reservation, "put")
+
+    def durable(
+            self, seq: int, names: Iterable[str], undo: Callable[[], None],
+    ) -> None:
+        """Wait for seq to reach the disk, snapshotting when it is due.
+
+        If the write failed, undo() runs under the names' locks before
+        the error is re-raised, so memory matches the journal again.
+        """
+        if self.journal is None:
+            return
+        try:
+            self.journal.wait(seq)
+        except OSError:
+            with self.locked_many(names):
+                undo()
+            raise
+        self.snapshot_if_due()
+
+    def snapshot_if_due(self) -> None:
+        """snapshot() every snapshot_every records, unless this thread still
+        holds an item lock (the snapshot takes all of them)."""
+        if self.journal is None:
+            return
+        due = self.journal.seq - self.journal.snapshot_seq >= self.snapshot_every
+        if due and threading.get_ident() not in self._owners.values():
+            self.snapshot()
+
+    def snapshot(self) -> int:
+        """Write the whole stock to the journal's snapshot; return its seq."""
+        if self.journal is None:
+            raise ValueError("no journal to snapshot to")
+        with self.locked_many(self.items):
+            seq = self.journal.rotate()
+            # Every lock is held, so no batch is between taking an id and
+            # journalling it: peek at the counter by taking one and resetting.
+            last = next(self._reservation_ids) - 1
+            self._reservation_ids = itertools.count(last + 1)
+            state = {
+                "seq": seq,
+                "on_band": {
+                    name: item_type.on_band
+                    for name, item_type in self.items.items()
+                },
+                "reservations": dict(self.reservations),
+                "last_reservation": last,
+            }
+        self.journal.save_snapshot(state)
+        return seq
+
+
+class AsyncInventory:
+    """Coroutine front end over an Inventory, with asyncio locks owned
+    per task:
+
+        shop = AsyncInventory(inventory)
+        async with shop.locked(item_type):
+            await shop.purchare(item_type)
+
+    Calls that may wait for the inventory's journal run in a worker
+    thread, so the event loop never blocks on an fsync.
+    """
+
+    def __init__(self, inventory: Inventory) -> None:
+        self.inventory = inventory
+        self._locks = {name: asyncio.Lock() for name in inventory.items}
+        self._owners: dict[str, asyncio.Task[Any]] = {}
+        self._acquired: dict[str, float] = {}
+        self.stats = {name: LockStats() for name in inventory.items}
+
+    async def lock(self, item_type: ItemType) -> None:
+        name = self.inventory.item(item_type).name
+        lock = self._locks[name]
+        start = time.perf_counter()
+        contended = lock.locked()
+        await lock.acquire()
+        acquired = time.perf_counter()
+        self.stats[name].waited(acquired - start, contended)
+        task = asyncio.current_task()
+        assert task is not None
+        self._owners[name] = task
+        self._acquired[name] = acquired
+
+    def unlock(self, item_type: ItemType) -> None:
+        name = self.inventory.item(item_type).name
+        if not self.is_locked(name):
+            raise ValueError(f"{name} is not locked by this task")
+        self.stats[name].held(time.perf_counter() - self._acquired[name])
+        del self._owners[name]
+        self._locks[name].release()
+
+    @contextlib.asynccontextmanager
+    async def locked(self, item_type: ItemType) -> AsyncIterator[ItemType]:
+        await self.lock(item_type)
+        try:
+            yield self.inventory.items[item_type.name]
+        finally:
+            self.unlock(item_type)
+
+    def is_locked(self, name: str) -> bool:
+        owner = self._owners.get(name)
+        return owner is not None and owner is asyncio.current_task()
+
+    async def run(self, call: Callable[..., Any], *args: Any) -> Any:
+        """call(*args) on the inventory, in a worker thread if it has a
+        journal to wait for."""
+        if self.inventory.journal is None:
+            return call(*args)
+        return await asyncio.to_thread(call, *args)
+
+    async def purchare(self, item_type: ItemType) -> int:
+        """Inventory.purchare() for the task holding item_type's lock."""
+        if not self.is_locked(item_type.name):
+            raise ValueError(f"{item_type.name} is not locked")
+        return await self.run(self.inventory.purchase, item_type)
+
+    async def purchase(self, item_type: ItemType) -> int:
+        async with self.locked(item_type):
+            return await self.purchare(item_type)
+
+    async def purchase_many(
+            self, lines: Iterable[tuple[ItemType, int]]
+    ) -> dict[str, int]:
+        return await self.run(self.inventory.purchase_many, list(lines))
+
+    async def reserve_many(
+            self, lines: Iterable[tuple[ItemType, int]]
+    ) -> Reservation:
+        return await self.run(self.inventory.reserve_many, list(lines))
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def benchmark(
+        items: int = 64, purchases: int = 20_000,
+        threads: tuple[int, ...] = (1, 2, 4, 8, 16),
+) -> None:
+    """Purchases/sec and p99 latency of Inventory.purchase() as the
+    number of threads buying random item types grows."""
+    for count in threads:
+        stock = [ItemType(f"item{n}") for n in range(items)]
+        for item_type in stock:
+            item_type.on_band = purchases
+        inventory = Inventory(stock)
+        latencies: list[list[float]] = [[] for _ in range(count)]
+
+        def buy(seen: list[float], seed: int) -> None:
+            generator = random.Random(seed)
+            for _ in range(purchases // count):
+                item_type = generator.choice(stock)
+                start = time.perf_counter()
+                inventory.purchase(item_type)
+                seen.append(time.perf_counter() - start)
+
+        workers = [
+            threading.Thread(target=buy, args=(latencies[n], n))
+            for n in range(count)
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - start
+        every = [latency for seen in latencies for latency in seen]
+        contended = sum(stats.contended for stats in inventory.stats.values())
+        print(f"{count:>3} threads: {len(every) / seconds:>10,.0f} purchases/s, "
+              f"p99 {percentile(every, 0.99) * 1e6:>8.1f}us, "
+              f"{contended} contended acquisitions")
+
+
+def benchmark_journal(
+        directory: str | None = None, operations: int = 2_000,
+        threads: int = 8, batch: int = 10,
+) -> None:
+    """Journalled purchases/sec: fsync per operation against group commit,
+    for single purchases and for purchase_many() of batch lines."""
+    def run(group_commit: bool, size: int) -> tuple[float, int]:
+        with tempfile.TemporaryDirectory(dir=directory) as place:
+            stock = [ItemType(f"item{n}") for n in range(64)]
+            for item_type in stock:
+                item_type.on_band = operations * batch
+            journal = InventoryLog(place, group_commit=group_commit)
+            inventory = Inventory(stock, journal=journal, snapshot_every=1_000)
+
+            def buy(seed: int) -> None:
+                generator = random.Random(seed)
+                for _ in range(operations // threads // size):
+                    if size == 1:
+                        inventory.purchase(generator.choice(stock))
+                    else:
+                        inventory.purchase_many(
+                            (item_type, 1)
+                            for item_type in generator.sample(stock, size)
+                        )
+
+            workers = [
+                threading.Thread(target=buy, args=(n,)) for n in range(threads)
+            ]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            seconds = time.perf_counter() - start
+            journal.close()
+            restored = Inventory(
+                [ItemType(item_type.name) for item_type in stock],
+                journal=InventoryLog(place),
+            )
+            assert all(
+                restored.items[name].on_band == item_type.on_band
+                for name, item_type in inventory.items.items()
+            )
+            restored.journal.close()
+            return operations / seconds, journal.fsyncs
+
+    for label, group_commit, size in (
+            ("fsync per op", False, 1),
+            ("group commit", True, 1),
+            ("fsync per op, batches", False, batch),
+            ("group commit, batches", True, batch),
+    ):
+        rate, fsyncs = run(group_commit, size)
+        print(f"{label:>22}: {rate:>9,.0f} purchases/s, {fsyncs} fsyncs")
+
+
+if __name__ == "__main__":
+    benchmark()
+    benchmark_journal()
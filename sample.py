@@ -1,15 +1,38 @@
 import abc
+import collections
+import collections.abc
+import contextlib
+import hashlib
+import mmap
+import operator
+import os
+import struct
+import tempfile
+import tracemalloc
 import weakref
 import datetime
-from typing import Iterable, Iterator, TypedDict, NamedTuple
+from typing import (
+    Callable, IO, Iterable, Iterator, Sequence, TypedDict, NamedTuple, TypeVar,
+    overload,
+)
 import math
 from pathlib import Path
 import csv
 import enum
 import random
+import heapq
+import time
+import itertools
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
 from dataclasses import dataclass
 
 
+T = TypeVar("T")
+
+
 class BadSampleRow(ValueError):
     "Raise excepition for unvalid row."
 
@@ -80,6 +103,63 @@ class SampleReader:
                     raise BadSampleRow(f"Invalid {row!r}") from ex
                 yield sample
 
+    def chunk_iter(self, size: int = 65_536) -> Iterator["SampleChunk"]:
+        """Yield blocks of up to size rows as typed column arrays.
+
+        Lines are split directly instead of going through a per-row dict;
+        each column of a block is converted with a single map(float).
+        Unlike sample_iter, quoted fields are not understood, and a bad
+        row fails its whole block before any of it is yielded.
+        """
+        fields = len(self.header)
+        with self.source.open() as source_file:
+            first = 1
+            while lines := list(itertools.islice(source_file, size)):
+                rows = [line.rstrip("\r\n").split(",") for line in lines]
+                try:
+                    yield self.parse_block(rows, fields)
+                except ValueError:
+                    self.locate_bad_row(rows, fields, first)
+                    raise
+                first += len(lines)
+
+    @staticmethod
+    def parse_block(rows: list[list[str]], fields: int) -> "SampleChunk":
+        rows = [row for row in rows if row != [""]]
+        if any(len(row) != fields for row in rows):
+            raise ValueError("wrong number of fields")
+        columns = list(zip(*rows)) or [()] * fields
+        return SampleChunk(
+            tuple(array("d", map(float, column)) for column in columns[:-1]),
+            list(columns[-1]),
+        )
+
+    def locate_bad_row(
+            self, rows: list[list[str]], fields: int, first: int
+    ) -> None:
+        for number, row in enumerate(rows, start=first):
+            if row == [""]:
+                continue
+            try:
+                if len(row) != fields:
+                    raise ValueError(f"expected {fields} fields")
+                for value in row[:-1]:
+                    float(value)
+            except ValueError as ex:
+                raise BadSampleRow(
+                    f"Invalid line {number} of {self.source}: {row!r}"
+                ) from ex
+
+
+class SampleChunk(NamedTuple):
+    """A block of rows as one array('d') per feature plus the class column."""
+
+    columns: tuple[array, ...]
+    species: list[str]
+
+    def __len__(self) -> int:
+        return len(self.species)
+
 
 class SampleDict(TypedDict):
     sepal_length: float
@@ -89,12 +169,42 @@ class SampleDict(TypedDict):
     species: str
 
 
+def sample_dict(row: dict[str, str]) -> SampleDict:
+    return SampleDict(
+        sepal_length=float(row["sepal_length"]),
+        sepal_width=float(row["sepal_width"]),
+        petal_length=float(row["petal_length"]),
+        petal_width=float(row["petal_width"]),
+        species=row["species"],
+    )
+
+
+def known_sample(row: SampleDict) -> KnowSample:
+    return KnowSample(
+        sample=Sample(
+            sepal_length=row["sepal_length"],
+            sepal_width=row["sepal_width"],
+            petal_length=row["petal_length"],
+            petal_width=row["petal_width"],
+        ),
+        species=row["species"],
+    )
+
+
 class SamplePartion(list[SampleDict], abc.ABC):
     @overload
     def __init__(self, *, training_subset: float = 0.80) -> None:
         ...
     
     @overload
+    def __init__(
+        self,
+        iterable: Iterable[SampleDict] | None = None,
+        *,
+        training_subset: float = 0.80,
+    ) -> None:
+        ...
+
     def __init__(
         self,
         iterable: Iterable[SampleDict] | None = None,
@@ -105,53 +215,857 @@ class SamplePartion(list[SampleDict], abc.ABC):
         if iterable:
             super().__init__(iterable)
         else:
-            super().__init__
+            super().__init__()
 
     @abc.abstractproperty
     @property
-    def testing(self) -> list[TrainingKnowSample]:
+    def testing(self) -> Sequence[TestingKnowSample]:
         ...
 
     @abc.abstractproperty
     @property
-    def training(self) -> list[TrainingKnowSample]:
+    def training(self) -> Sequence[TrainingKnowSample]:
         ...
 
 
+def training_known(row: SampleDict) -> TrainingKnowSample:
+    return TrainingKnowSample(known_sample(row))
+
+
+def testing_known(row: SampleDict) -> TestingKnowSample:
+    return TestingKnowSample(known_sample(row))
+
+
+class RowChain(collections.abc.Sequence[int]):
+    """Several index sequences read as one, without concatenating them."""
+
+    def __init__(self, *parts: Sequence[int]) -> None:
+        self.parts = parts
+
+    def __len__(self) -> int:
+        return sum(len(part) for part in self.parts)
+
+    def __getitem__(self, index):  # type: ignore[override]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        for part in self.parts:
+            if index < len(part):
+                return part[index]
+            index -= len(part)
+        raise IndexError(index)
+
+    def __iter__(self) -> Iterator[int]:
+        return itertools.chain.from_iterable(self.parts)
+
+
+class PartitionView(collections.abc.Sequence[T]):
+    """The base rows picked out by an index sequence, converted on access."""
+
+    def __init__(
+            self,
+            base: Sequence[SampleDict],
+            rows: Sequence[int],
+            make: Callable[[SampleDict], T],
+    ) -> None:
+        self.base = base
+        self.rows = rows
+        self.make = make
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, index):  # type: ignore[override]
+        if isinstance(index, slice):
+            return PartitionView(self.base, self.rows[index], self.make)
+        return self.make(self.base[self.rows[index]])
+
+    def __iter__(self) -> Iterator[T]:
+        base, make = self.base, self.make
+        return (make(base[row]) for row in self.rows)
+
+
 class ShufflingSamplePartition(SamplePartion):
+    """Partitions by permuting row numbers, never the rows.
+
+    training and testing are PartitionViews over this list reading the
+    live training_rows/testing_rows arrays, so rows added later through
+    add() show up in them; folds() yields cross-validation splits as
+    views over the same permutation.
+    """
+
     def __init__(
             self,
             iterable: Iterable[SampleDict] | None = None,
             *,
             training_subset: float = 0.80,
+            seed: int | None = None,
+            stratified: bool = False,
     ) -> None:
         super().__init__(iterable, training_subset=training_subset)
         self.split: int | None = None
+        self.training_rows = array("L")
+        self.testing_rows = array("L")
+        self.random = random.Random(seed)
+        self.stratified = stratified
 
     def shuffle(self) -> None:
-        if not self.split:
-            random.shuffle(self)
-            self.split = int(len(self) * self.training_subset)
+        partitioned = len(self.training_rows) + len(self.testing_rows)
+        if self.split is None or partitioned != len(self):
+            self.training_rows, self.testing_rows = self.permute(
+                PartitionView(self, range(len(self)), operator.itemgetter("species"))
+            )
+            self.split = len(self.training_rows)
+
+    def permute(self, species: Sequence[str]) -> tuple[array, array]:
+        """Training and testing row numbers for rows labelled species.
+
+        Only the length of species is read unless stratified, so the rows
+        themselves may live elsewhere, e.g. in a mapped SampleCache.
+        """
+        if self.stratified:
+            return self.stratify(species)
+        order = array("L", range(len(species)))
+        self.random.shuffle(order)
+        split = int(len(species) * self.training_subset)
+        return order[:split], order[split:]
+
+    def stratify(self, species: Sequence[str]) -> tuple[array, array]:
+        """Each species contributes training_subset of its own rows."""
+        by_species: dict[str, list[int]] = {}
+        for row, name in enumerate(species):
+            by_species.setdefault(name, []).append(row)
+        training, testing = array("L"), array("L")
+        for rows in by_species.values():
+            self.random.shuffle(rows)
+            split = int(len(rows) * self.training_subset)
+            training.extend(rows[:split])
+            testing.extend(rows[split:])
+        return training, testing
+
+    def add(self, rows: Iterable[SampleDict]) -> tuple[range, array, array]:
+        """Append rows, sending each to training with probability
+        training_subset, without reshuffling the existing ones.
+
+        Returns the new row numbers and which of them went to each side.
+        """
+        self.shuffle()
+        start = len(self)
+        self.extend(rows)
+        added = range(start, len(self))
+        training, testing = array("L"), array("L")
+        for row in added:
+            side = training if self.random.random() < self.training_subset else testing
+            side.append(row)
+        self.training_rows.extend(training)
+        self.testing_rows.extend(testing)
+        self.split = len(self.training_rows)
+        return added, training, testing
 
     @property
-    def training(self) -> list[TrainingKnowSample]:
+    def training(self) -> PartitionView[TrainingKnowSample]:
         self.shuffle()
-        return [TrainingKnowSample(**sd) for sd in self[: self.split]]
-    
+        return PartitionView(self, self.training_rows, training_known)
+
+    @property
+    def testing(self) -> PartitionView[TestingKnowSample]:
+        self.shuffle()
+        return PartitionView(self, self.testing_rows, testing_known)
+
+    def folds(
+            self, count: int = 10
+    ) -> Iterator[tuple[PartitionView[TrainingKnowSample],
+                        PartitionView[TestingKnowSample]]]:
+        """k-fold cross-validation over the shuffled order.
+
+        When stratified, every fold holds each species in proportion:
+
+        >>> rows = [
+        ...     dict(sepal_length=1.0, sepal_width=1.0, petal_length=1.0,
+        ...          petal_width=1.0, species=species)
+        ...     for species in ("setosa", "versicolor", "virginica")
+        ...     for _ in range(50)
+        ... ]
+        >>> partition = ShufflingSamplePartition(rows, seed=1, stratified=True)
+        >>> [
+        ...     sorted(Counter(t.sample.species for t in testing).items())
+        ...     for _, testing in partition.folds(5)
+        ... ]  # doctest: +NORMALIZE_WHITESPACE
+        [[('setosa', 10), ('versicolor', 10), ('virginica', 10)],
+         [('setosa', 10), ('versicolor', 10), ('virginica', 10)],
+         [('setosa', 10), ('versicolor', 10), ('virginica', 10)],
+         [('setosa', 10), ('versicolor', 10), ('virginica', 10)],
+         [('setosa', 10), ('versicolor', 10), ('virginica', 10)]]
+        """
+        folds = self.fold_rows(count)
+        for i, testing in enumerate(folds):
+            yield (
+                PartitionView(
+                    self, RowChain(*folds[:i], *folds[i + 1 :]), training_known
+                ),
+                PartitionView(self, testing, testing_known),
+            )
+
+    def fold_rows(self, count: int) -> list[Sequence[int]]:
+        """The row numbers of each fold.
+
+        Unstratified folds are consecutive runs of the shuffled order.
+        Stratified ones deal the rows of each species out in turn, so a
+        species of n rows puts n // count or one more into every fold.
+        """
+        self.shuffle()
+        order = memoryview(self.training_rows + self.testing_rows)
+        if not self.stratified:
+            bounds = [len(self) * i // count for i in range(count + 1)]
+            return [order[start:stop] for start, stop in zip(bounds, bounds[1:])]
+        by_species: dict[str, list[int]] = {}
+        for row in order:
+            by_species.setdefault(self[row]["species"], []).append(row)
+        folds = [array("L") for _ in range(count)]
+        # One running position across species keeps fold sizes within one.
+        for position, row in enumerate(
+            itertools.chain.from_iterable(by_species.values())
+        ):
+            folds[position % count].append(row)
+        return folds
+
+
+class EncodedSpecies(collections.abc.Sequence[str]):
+    """Species labels stored as small integer codes into a name table."""
+
+    def __init__(self, codes: "array[int] | memoryview", names: list[str]) -> None:
+        self.codes = codes
+        self.names = names
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @overload
+    def __getitem__(self, index: int) -> str:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "EncodedSpecies":
+        ...
+
+    def __getitem__(self, index: int | slice) -> "str | EncodedSpecies":
+        if isinstance(index, slice):
+            return EncodedSpecies(self.codes[index], self.names)
+        return self.names[self.codes[index]]
+
+
+class SampleMatrix:
+    """Training features packed column-major into one contiguous float64
+array, plus the species label of every row.
+
+    A matrix may also be a row range of a larger buffer: column i then
+    starts at offset + i * stride.
+    """
+
+    features = ("sepal_length", "sepal_width", "petal_length", "petal_width")
+    _tokens = itertools.count()
+
+    def __init__(
+            self,
+            data: "array[float] | memoryview",
+            species: Sequence[str],
+            stride: int | None = None,
+            offset: int = 0,
+    ) -> None:
+        #: Identifies this matrix's rows in a DistanceCache; extend() only
+        #: adds rows, so it keeps the token.
+        self.token = next(self._tokens)
+        self.data = data
+        self.species = species
+        self.size = len(species)
+        self.stride = self.size if stride is None else stride
+        self.offset = offset
+
+    @classmethod
+    def from_known(cls, samples: Iterable[KnowSample]) -> "SampleMatrix":
+        rows = list(samples)
+        data = array("d")
+        for name in cls.features:
+            data.extend(getattr(row.sample, name) for row in rows)
+        return cls(data, [row.species for row in rows])
+
+    def __len__(self) -> int:
+        return self.size
+
+    def columns(self) -> tuple[memoryview, ...]:
+        view = memoryview(self.data)
+        starts = (
+            self.offset + i * self.stride for i in range(len(self.features))
+        )
+        return tuple(view[start : start + self.size] for start in starts)
+
+    def rows(self) -> Iterator[Sample]:
+        for values in zip(*self.columns()):
+            yield Sample(*values)
+
+    def slice(self, start: int, stop: int) -> "SampleMatrix":
+        """Rows start:stop sharing this matrix's buffer."""
+        return SampleMatrix(
+            self.data, self.species[start:stop], self.stride, self.offset + start
+        )
+
+    def extend(self, samples: Iterable[KnowSample]) -> None:
+        """Append rows in place.
+
+        Columns are kept stride apart with spare room after each; when
+        the room runs out (or the matrix is a view into someone else's
+        buffer) they are copied into a new array with doubled stride.
+        """
+        rows = list(samples)
+        size = self.size + len(rows)
+        if (
+            size > self.stride
+            or not isinstance(self.data, array)
+            or not isinstance(self.species, list)
+        ):
+            stride = max(size, 2 * self.size, 1024)
+            data = array("d", bytes(8 * stride * len(self.features)))
+            for i, column in enumerate(self.columns()):
+                data[i * stride : i * stride + self.size] = array("d", column)
+            self.data, self.stride, self.offset = data, stride, 0
+            self.species = list(self.species)
+        for i, name in enumerate(self.features):
+            start = self.offset + i * self.stride + self.size
+            self.data[start : start + len(rows)] = array(
+                "d", (getattr(row.sample, name) for row in rows)
+            )
+        self.species.extend(row.species for row in rows)
+        self.size = size
+
+    def truncate(self, size: int) -> None:
+        """Drop the rows from size on; extend() reuses their room."""
+        if isinstance(self.species, list):
+            del self.species[size:]
+        self.size = size
+
+
+class CacheHeader(NamedTuple):
+    magic: bytes
+    version: int
+    typecode: bytes
+    rows: int
+    source_size: int
+    source_mtime_ns: int
+    source_sha256: bytes
+    names_length: int
+
+
+class SampleCache:
+    """Binary columnar copy of a sample CSV, opened through mmap.
+
+    Layout: a fixed header, the species names (utf-8, one per line,
+    padded to 8 bytes), one column per feature in the header's typecode
+    ("d" or "f"), then a uint16 species code per row.  Rows are stored
+    in shuffled order, so any leading run of them is a random sample.
+    The header keeps the source size, mtime and SHA-256 so a stale cache
+    is detected.
+    """
+
+    magic = b"SMPC"
+    version = 2
+    #: Rows gathered per step when write() shuffles a column.
+    shuffle_chunk = 65536
+    layout = struct.Struct("<4sHc1xQQQ32sI4x")
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._mmap: mmap.mmap | None = None
+
+    @classmethod
+    def for_source(
+            cls, source: Path, path: Path | None = None, typecode: str = "d"
+    ) -> "SampleCache":
+        """The cache next to source, (re)written if missing or stale."""
+        cache = cls(path or source.with_suffix(f"{source.suffix}.samples"))
+        if not cache.is_fresh(source):
+            cache.write(source, typecode)
+        return cache
+
+    @staticmethod
+    def digest(source: Path) -> bytes:
+        with source.open("rb") as source_file:
+            return hashlib.file_digest(source_file, "sha256").digest()
+
+    def header(self) -> CacheHeader:
+        with self.path.open("rb") as cache_file:
+            return CacheHeader(*self.layout.unpack(
+                cache_file.read(self.layout.size)
+            ))
+
+    def is_fresh(self, source: Path) -> bool:
+        """Size and mtime decide; the hash is only consulted when the
+        mtime moved but the size did not, and a match records the new
+        mtime so the next check needs no hash."""
+        if not self.path.exists():
+            return False
+        header = self.header()
+        if header.magic != self.magic or header.version != self.version:
+            return False
+        stat = source.stat()
+        if stat.st_size != header.source_size:
+            return False
+        if stat.st_mtime_ns == header.source_mtime_ns:
+            return True
+        if self.digest(source) != header.source_sha256:
+            return False
+        with self.path.open("r+b") as cache_file:
+            cache_file.write(self.layout.pack(
+                *header._replace(source_mtime_ns=stat.st_mtime_ns)
+            ))
+        return True
+
+    def write(
+            self, source: Path, typecode: str = "d", seed: int | None = None,
+    ) -> None:
+        """Convert source in chunks, spilling each column to a temporary
+file so memory stays bounded, then assemble the columns in an order
+shuffled with seed and rename into place."""
+        stat = source.stat()
+        codes: dict[str, int] = {}
+        rows = 0
+        with contextlib.ExitStack() as stack:
+            spills = [
+                stack.enter_context(tempfile.TemporaryFile())
+                for _ in range(len(SampleMatrix.features) + 1)
+            ]
+            for chunk in SampleReader(source).chunk_iter():
+                for column, spill in zip(chunk.columns, spills):
+                    array(typecode, column).tofile(spill)
+                for name in chunk.species:
+                    codes.setdefault(name, len(codes))
+                array("H", (codes[name] for name in chunk.species)).tofile(
+                    spills[-1]
+                )
+                rows += len(chunk)
+            if len(codes) > 0xFFFF:
+                raise ValueError(f"Too many species: {len(codes)}")
+
+            names = "\n".join(codes).encode("utf-8")
+            names += bytes(-len(names) % 8)
+            order = array("L", range(rows))
+            random.Random(seed).shuffle(order)
+            temporary = self.path.with_suffix(f"{self.path.suffix}.tmp")
+            with temporary.open("wb") as cache_file:
+                cache_file.write(self.layout.pack(
+                    self.magic, self.version, typecode.encode("ascii"),
+                    rows, stat.st_size, stat.st_mtime_ns,
+                    self.digest(source), len(names),
+                ))
+                cache_file.write(names)
+                spilled = [typecode] * len(SampleMatrix.features) + ["H"]
+                for spill, code in zip(spills, spilled):
+                    self.shuffled(spill, code, order, cache_file)
+            temporary.replace(self.path)
+
+    def shuffled(
+            self, spill: IO[bytes], typecode: str, order: "array[int]",
+            target: IO[bytes],
+    ) -> None:
+        """Write the column in spill to target, its rows taken in order."""
+        if not order:
+            return
+        with mmap.mmap(spill.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            column = memoryview(mapped).cast(typecode)
+            try:
+                for start in range(0, len(order), self.shuffle_chunk):
+                    rows = order[start : start + self.shuffle_chunk]
+                    array(typecode, map(column.__getitem__, rows)).tofile(target)
+            finally:
+                column.release()
+
+    def open(self) -> SampleMatrix:
+        """Map the file and return a matrix whose columns and species codes
+are memoryviews straight into the mapping."""
+        header = self.header()
+        if self._mmap is None:
+            with self.path.open("rb") as cache_file:
+                self._mmap = mmap.mmap(
+                    cache_file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        view = memoryview(self._mmap)
+        start = self.layout.size
+        names = bytes(view[start : start + header.names_length])
+        start += header.names_length
+        typecode = header.typecode.decode("ascii")
+        width = header.rows * len(SampleMatrix.features)
+        end = start + width * array(typecode).itemsize
+        features = view[start:end].cast(typecode)
+        codes = view[end : end + header.rows * 2].cast("H")
+        species = EncodedSpecies(
+            codes, names.rstrip(b"\0").decode("utf-8").split("\n")
+        )
+        return SampleMatrix(features, species)
+
+    def close(self) -> None:
+        """Unmap the file; matrices from open() must be released first."""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self) -> "SampleCache":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+class TestingRows(collections.abc.Sequence[TestingKnowSample]):
+    """The rows of a SampleMatrix as TestingKnowSample, each built on
+    first access and kept, so a classification set on it stays."""
+
+    def __init__(self, matrix: SampleMatrix) -> None:
+        self.matrix = matrix
+        self._built: dict[int, TestingKnowSample] = {}
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+    def __getitem__(self, index):  # type: ignore[override]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        if index not in self._built:
+            values = (column[index] for column in self.matrix.columns())
+            self._built[index] = TestingKnowSample(
+                KnowSample(Sample(*values), self.matrix.species[index])
+            )
+        return self._built[index]
+
+    def extend(self, samples: Iterable[KnowSample]) -> None:
+        self.matrix.extend(samples)
+
+    def truncate(self, size: int) -> None:
+        self.matrix.truncate(size)
+        for index in [i for i in self._built if i >= size]:
+            del self._built[index]
+
+
+class TrainingRows(collections.abc.Sequence[TrainingKnowSample]):
+    """The rows of a SampleMatrix, built as TrainingKnowSample on access."""
+
+    def __init__(self, matrix: SampleMatrix) -> None:
+        self.matrix = matrix
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+    def __getitem__(self, index):  # type: ignore[override]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        values = (column[index] for column in self.matrix.columns())
+        return TrainingKnowSample(
+            KnowSample(Sample(*values), self.matrix.species[index])
+        )
+
+
+class SampleView:
+    """One row of a SampleStore.
+
+    Reads through to the store's columns and offers the attribute names
+    of Sample, KnowSample and TestingKnowSample, so Distance and the
+    classifier accept it in place of those NamedTuples.
+    """
+
+    __slots__ = ("store", "row")
+
+    def __init__(self, store: "SampleStore", row: int) -> None:
+        self.store = store
+        self.row = row
+
     @property
-    def testing(self) -> list[TestingKnowSample]:
-        self.shuffle
-        return [TestingKnowSample(**sd) for sd in self[self.split :]]
+    def sepal_length(self) -> float:
+        return self.store.columns[0][self.row]
+
+    @property
+    def sepal_width(self) -> float:
+        return self.store.columns[1][self.row]
+
+    @property
+    def petal_length(self) -> float:
+        return self.store.columns[2][self.row]
+
+    @property
+    def petal_width(self) -> float:
+        return self.store.columns[3][self.row]
+
+    @property
+    def species(self) -> str:
+        return self.store.names[self.store.species[self.row]]
+
+    @property
+    def classification(self) -> str | None:
+        code = self.store.classification[self.row]
+        return None if code == SampleStore.unclassified else self.store.names[code]
+
+    @classification.setter
+    def classification(self, value: str | None) -> None:
+        self.store.classification[self.row] = (
+            SampleStore.unclassified if value is None
+            else self.store.code(value)
+        )
+
+    @property
+    def sample(self) -> "SampleView":
+        return self
+
+    def __iter__(self) -> Iterator[float]:
+        return (column[self.row] for column in self.store.columns)
+
+    def __getitem__(self, axis: int) -> float:
+        return self.store.columns[axis][self.row]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (SampleView, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(tuple(self))
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}({Sample(*self)!r}, "
+            f"species={self.species!r})"
+        )
+
+
+class SampleStore(collections.abc.Sequence[SampleView]):
+    """Known samples held column-wise: one array('d') per feature and
+uint16 species/classification codes into a shared name table."""
+
+    unclassified = 0xFFFF
+
+    def __init__(self) -> None:
+        self.columns = tuple(array("d") for _ in SampleMatrix.features)
+        self.species = array("H")
+        self.classification = array("H")
+        self.names: list[str] = []
+        self._codes: dict[str, int] = {}
+
+    @classmethod
+    def from_known(cls, samples: Iterable[KnowSample]) -> "SampleStore":
+        store = cls()
+        store.extend(samples)
+        return store
+
+    def code(self, name: str) -> int:
+        if name not in self._codes:
+            if len(self.names) >= self.unclassified:
+                raise ValueError(f"Too many species: {len(self.names)}")
+            self._codes[name] = len(self.names)
+            self.names.append(name)
+        return self._codes[name]
+
+    def append(self, known: KnowSample) -> None:
+        for column, value in zip(self.columns, known.sample):
+            column.append(value)
+        self.species.append(self.code(known.species))
+        self.classification.append(self.unclassified)
+
+    def extend(self, samples: Iterable[KnowSample]) -> None:
+        for known in samples:
+            self.append(known)
+
+    def append_row(self, row: SampleDict) -> None:
+        """append() straight from a parsed row, without a KnowSample."""
+        for column, name in zip(self.columns, SampleMatrix.features):
+            column.append(row[name])  # type: ignore[literal-required]
+        self.species.append(self.code(row["species"]))
+        self.classification.append(self.unclassified)
+
+    def truncate(self, size: int) -> None:
+        """Drop the rows from size on."""
+        for column in (*self.columns, self.species, self.classification):
+            del column[size:]
+
+    def take(self, rows: Sequence[int]) -> "SampleStore":
+        """The given rows, in that order, as a store sharing the name table."""
+        store = type(self)()
+        store.names, store._codes = self.names, self._codes
+        for column, source in zip(store.columns, self.columns):
+            column.extend(map(source.__getitem__, rows))
+        store.species.extend(map(self.species.__getitem__, rows))
+        store.classification.extend(map(self.classification.__getitem__, rows))
+        return store
+
+    def __len__(self) -> int:
+        return len(self.species)
+
+    @overload
+    def __getitem__(self, index: int) -> SampleView:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[SampleView]:
+        ...
+
+    def __getitem__(self, index: int | slice) -> SampleView | list[SampleView]:
+        if isinstance(index, slice):
+            return [SampleView(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return SampleView(self, index)
+
+    def matrix(self) -> SampleMatrix:
+        data = array("d")
+        for column in self.columns:
+            data.extend(column)
+        return SampleMatrix(data, EncodedSpecies(self.species, self.names))
+
+    def nbytes(self) -> int:
+        arrays = (*self.columns, self.species, self.classification)
+        return sum(a.buffer_info()[1] * a.itemsize for a in arrays)
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    capacity: int
+
+
+class DistanceCache:
+    """Bounded LRU of computed distances from query samples to matrix rows.
+
+    Rows are identified by their matrix's token and row number, never by
+    their values, so equal samples with different labels keep separate
+    entries.  lookup() holds one row's distance, distances() the whole
+    vector over a matrix, topped up when the matrix has grown since.
+    size and capacity are rough bytes: the dict slot, key tuple and
+    float of an entry, plus a float per element of a vector.
+    """
+
+    entry_bytes = 240
+    element_bytes = 32
+
+    def __init__(self, budget: int = 64 * 1024 * 1024) -> None:
+        self.capacity = budget
+        self.size = 0
+        self._entries: collections.OrderedDict[
+            tuple, tuple[float | list[float], int]
+        ] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get(self, key: tuple) -> float | list[float] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _put(self, key: tuple, value: float | list[float], cost: int) -> None:
+        entries = self._entries
+        if key in entries:
+            self.size -= entries.pop(key)[1]
+        entries[key] = (value, cost)
+        self.size += cost
+        while self.size > self.capacity and len(entries) > 1:
+            self.size -= entries.popitem(last=False)[1][1]
+            self.evictions += 1
+
+    def lookup(
+            self, metric: "Distance", sample: Sample, matrix: "SampleMatrix",
+            row: int, point: Sample,
+    ) -> float:
+        """Distance from sample to row of matrix, whose values are point."""
+        key = (type(metric), sample, matrix.token, row)
+        value = self._get(key)
+        if value is None:
+            value = metric.distance(sample, point)
+            self._put(key, value, self.entry_bytes)
+        return value  # type: ignore[return-value]
+
+    def distances(
+            self, metric: "Distance", sample: Sample, matrix: "SampleMatrix"
+    ) -> list[float]:
+        """metric.distances(sample, matrix), computing only rows not seen."""
+        key = (type(metric), sample, matrix.token)
+        value = self._get(key)
+        known: list[float] = [] if value is None else value  # type: ignore[assignment]
+        if len(known) < len(matrix):
+            known = known + metric.distances(
+                sample, matrix.slice(len(known), len(matrix))
+            )
+            self._put(
+                key, known, self.entry_bytes + self.element_bytes * len(known)
+            )
+        return known
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            self.hits, self.misses, self.evictions, self.size, self.capacity,
+        )
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
 
 
 class Distance:
     """Get distance."""
 
+    #: True when the distance obeys the triangle inequality, which
+    #: tree indexes rely on to prune.
+    metric = False
+
+    def __init__(self, cache: DistanceCache | None = None) -> None:
+        self.cache = cache
+
     def distance(self, s1: Sample, s2: Sample) -> float:
         pass
 
+    def cached(
+            self, sample: Sample, matrix: "SampleMatrix", row: int, point: Sample
+    ) -> float:
+        """distance(sample, point) for point = matrix row, through the
+        cache when one was given."""
+        if self.cache is None:
+            return self.distance(sample, point)
+        return self.cache.lookup(self, sample, matrix, row, point)
+
+    def cached_distances(
+            self, sample: Sample, matrix: "SampleMatrix"
+    ) -> list[float]:
+        """distances(), through the cache when one was given."""
+        if self.cache is None:
+            return self.distances(sample, matrix)
+        return self.cache.distances(self, sample, matrix)
+
+    def distances(self, sample: Sample, matrix: SampleMatrix) -> list[float]:
+        """Distance from sample to every row of the matrix."""
+        return [self.distance(sample, row) for row in matrix.rows()]
+
+    def distances_to(
+            self, sample: Sample, points: Iterable[Sample]
+    ) -> list[float]:
+        """Distance from sample to each of points."""
+        return [self.distance(sample, point) for point in points]
+
 
 class MD(Distance):
+    metric = True
+
     def distance(self, s1: Sample, s2: Sample) -> float:
         return sum(
             [
@@ -162,6 +1076,22 @@ class MD(Distance):
             ]
         )
 
+    def distances(self, sample: Sample, matrix: SampleMatrix) -> list[float]:
+        q1, q2, q3, q4 = sample
+        return [
+            abs(a - q1) + abs(b - q2) + abs(c - q3) + abs(d - q4)
+            for a, b, c, d in zip(*matrix.columns())
+        ]
+
+    def distances_to(
+            self, sample: Sample, points: Iterable[Sample]
+    ) -> list[float]:
+        q1, q2, q3, q4 = sample
+        return [
+            abs(a - q1) + abs(b - q2) + abs(c - q3) + abs(d - q4)
+            for a, b, c, d in points
+        ]
+
 
 class SD(Distance):
     def distance(self, s1: Sample, s2: Sample) -> float:
@@ -183,6 +1113,8 @@ class SD(Distance):
 
 
 class CD(Distance):
+    metric = True
+
     def distance(self, s1: Sample, s2: Sample) -> float:
         return sum(
             [
@@ -193,8 +1125,26 @@ class CD(Distance):
             ]
         )
 
+    def distances(self, sample: Sample, matrix: SampleMatrix) -> list[float]:
+        q1, q2, q3, q4 = sample
+        return [
+            abs(a - q1) + abs(b - q2) + abs(c - q3) + abs(d - q4)
+            for a, b, c, d in zip(*matrix.columns())
+        ]
+
+    def distances_to(
+            self, sample: Sample, points: Iterable[Sample]
+    ) -> list[float]:
+        q1, q2, q3, q4 = sample
+        return [
+            abs(a - q1) + abs(b - q2) + abs(c - q3) + abs(d - q4)
+            for a, b, c, d in points
+        ]
+
 
 class ED(Distance):
+    metric = True
+
     def distance(self, s1: Sample, s2: Sample) -> float:
         return math.hypot(
             s1.sepal_length - s2.sepal_length,
@@ -203,6 +1153,404 @@ class ED(Distance):
             s1.petal_width - s2.petal_width,
         )
 
+    def distances(self, sample: Sample, matrix: SampleMatrix) -> list[float]:
+        q1, q2, q3, q4 = sample
+        hypot = math.hypot
+        return [
+            hypot(a - q1, b - q2, c - q3, d - q4)
+            for a, b, c, d in zip(*matrix.columns())
+        ]
+
+    def distances_to(
+            self, sample: Sample, points: Iterable[Sample]
+    ) -> list[float]:
+        return list(map(math.dist, itertools.repeat(sample), points))
+
+
+class NeighbourIndex(abc.ABC):
+    """Answers k-nearest queries against one SampleMatrix."""
+
+    def __init__(self, matrix: SampleMatrix, algorithm: Distance) -> None:
+        self.matrix = matrix
+        self.algorithm = algorithm
+
+    @abc.abstractmethod
+    def query(self, sample: Sample, k: int) -> list[int]:
+        """Row numbers of the k nearest rows, nearest first."""
+        ...
+
+    def add(self, rows: range) -> None:
+        """Take in rows just appended to the matrix."""
+
+    def exact(self, sample: Sample, k: int) -> list[int]:
+        """The k nearest rows by a scan over the whole matrix."""
+        distances = self.algorithm.cached_distances(sample, self.matrix)
+        return heapq.nsmallest(
+            k, range(len(distances)), key=distances.__getitem__
+        )
+
+
+class BruteForceIndex(NeighbourIndex):
+    def query(self, sample: Sample, k: int) -> list[int]:
+        return self.exact(sample, k)
+
+
+class TreeIndex(NeighbourIndex):
+    """Common leaf scan and best-k bookkeeping for the tree indexes.
+
+    A node is either a leaf (a list of row numbers, or a 3-tuple ending
+    in one) or a tuple whose last three items are its number of rows and
+    the two child nodes.
+    """
+
+    leaf_size = 16
+    #: insert() rebuilds a subtree once one child holds more than this
+    #: share of its rows, which keeps the depth O(log n) however the
+    #: appended rows drift.
+    balance = 0.75
+
+    def __init__(self, matrix: SampleMatrix, algorithm: Distance) -> None:
+        super().__init__(matrix, algorithm)
+        self.points = list(matrix.rows())
+        self.root = self.build(list(range(len(self.points))))
+
+    def spread_axis(self, rows: list[int]) -> int:
+        points = self.points
+        return max(
+            range(len(SampleMatrix.features)),
+            key=lambda axis: (
+                max(points[r][axis] for r in rows)
+                - min(points[r][axis] for r in rows)
+            ),
+        )
+
+    def split(self, rows: list[int]) -> tuple[int, float, list[int], list[int]]:
+        axis = self.spread_axis(rows)
+        rows.sort(key=lambda r: self.points[r][axis])
+        middle = len(rows) // 2
+        return axis, self.points[rows[middle]][axis], rows[:middle], rows[middle:]
+
+    @abc.abstractmethod
+    def build(self, rows: list[int]) -> tuple | list[int]:
+        ...
+
+    @staticmethod
+    def size(node: tuple | list[int]) -> int:
+        if isinstance(node, list):
+            return len(node)
+        return len(node[2]) if len(node) == 3 else node[-3]
+
+    @staticmethod
+    def leaves(node: tuple | list[int]) -> Iterator[list[int]]:
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                yield node
+            elif len(node) == 3:
+                yield node[2]
+            else:
+                stack.extend(node[-2:])
+
+    def rebalance(self, node: tuple) -> tuple | list[int]:
+        """node, rebuilt if one child holds more than balance of its rows."""
+        size, left, right = node[-3:]
+        if max(self.size(left), self.size(right)) > self.balance * size:
+            return self.build(
+                list(itertools.chain.from_iterable(self.leaves(node)))
+            )
+        return node
+
+    def scan(
+            self, rows: list[int], sample: Sample, k: int,
+            best: list[tuple[float, int]],
+    ) -> None:
+        """Keep the k nearest seen so far in a max-heap of (-distance, row)."""
+        distance = self.algorithm.cached
+        matrix, points = self.matrix, self.points
+        for row in rows:
+            d = distance(sample, matrix, row, points[row])
+            if len(best) < k:
+                heapq.heappush(best, (-d, row))
+            elif d < -best[0][0]:
+                heapq.heapreplace(best, (-d, row))
+
+    @abc.abstractmethod
+    def search(
+            self, node: tuple | list[int], sample: Sample, k: int,
+            best: list[tuple[float, int]],
+    ) -> None:
+        ...
+
+    @abc.abstractmethod
+    def insert(self, node: tuple | list[int], row: int) -> tuple | list[int]:
+        """Return node with row added, rebuilding only along its path."""
+        ...
+
+    def add(self, rows: range) -> None:
+        columns = self.matrix.columns()
+        for row in rows:
+            self.points.append(Sample(*(column[row] for column in columns)))
+            self.root = self.insert(self.root, row)
+
+    def query(self, sample: Sample, k: int) -> list[int]:
+        best: list[tuple[float, int]] = []
+        self.search(self.root, sample, k, best)
+        return [row for _, row in sorted((-d, row) for d, row in best)]
+
+
+class KDTreeIndex(TreeIndex):
+    """Axis-aligned median splits; prunes on the distance to the split
+plane, which bounds the Euclidean distance from below."""
+
+    def build(self, rows: list[int]) -> tuple | list[int]:
+        if len(rows) <= self.leaf_size:
+            return rows
+        axis, value, left, right = self.split(rows)
+        return (axis, value, len(rows), self.build(left), self.build(right))
+
+    def insert(self, node: tuple | list[int], row: int) -> tuple | list[int]:
+        if isinstance(node, list):
+            node.append(row)
+            return self.build(node) if len(node) > 2 * self.leaf_size else node
+        axis, value, size, left, right = node
+        if self.points[row][axis] < value:
+            left = self.insert(left, row)
+        else:
+            right = self.insert(right, row)
+        return self.rebalance((axis, value, size + 1, left, right))
+
+    def search(
+            self, node: tuple | list[int], sample: Sample, k: int,
+            best: list[tuple[float, int]],
+    ) -> None:
+        if isinstance(node, list):
+            self.scan(node, sample, k, best)
+            return
+        axis, value, _, left, right = node
+        delta = sample[axis] - value
+        near, far = (left, right) if delta < 0 else (right, left)
+        self.search(near, sample, k, best)
+        if len(best) < k or abs(delta) < -best[0][0]:
+            self.search(far, sample, k, best)
+
+
+class BallTreeIndex(TreeIndex):
+    """Nested balls around centroids; prunes with the triangle
+inequality, so any metric Distance works."""
+
+    def ball(self, rows: list[int]) -> tuple[Sample, float]:
+        points = self.points
+        center = Sample(*(
+            sum(points[r][axis] for r in rows) / len(rows)
+            for axis in range(len(SampleMatrix.features))
+        ))
+        radius = max(self.algorithm.distance(center, points[r]) for r in rows)
+        return center, radius
+
+    def build(self, rows: list[int]) -> tuple | list[int]:
+        center, radius = self.ball(rows)
+        if len(rows) <= self.leaf_size:
+            return (center, radius, rows)
+        _, _, left, right = self.split(rows)
+        return (center, radius, len(rows), self.build(left), self.build(right))
+
+    def insert(self, node: tuple | list[int], row: int) -> tuple | list[int]:
+        """Centres stay put; radii grow to keep covering every point."""
+        point = self.points[row]
+        center = node[0]
+        radius = max(node[1], self.algorithm.distance(center, point))
+        if len(node) == 3:
+            rows = node[2]
+            rows.append(row)
+            if len(rows) > 2 * self.leaf_size:
+                return self.build(rows)
+            return (center, radius, rows)
+        _, _, size, left, right = node
+        if (
+            self.algorithm.distance(point, left[0])
+            <= self.algorithm.distance(point, right[0])
+        ):
+            left = self.insert(left, row)
+        else:
+            right = self.insert(right, row)
+        return self.rebalance((center, radius, size + 1, left, right))
+
+    def search(
+            self, node: tuple | list[int], sample: Sample, k: int,
+            best: list[tuple[float, int]],
+    ) -> None:
+        center, radius = node[:2]
+        bound = self.algorithm.distance(sample, center) - radius
+        if len(best) == k and bound >= -best[0][0]:
+            return
+        if len(node) == 3:
+            self.scan(node[2], sample, k, best)
+            return
+        children = sorted(
+            node[-2:], key=lambda child: self.algorithm.distance(sample, child[0])
+        )
+        for child in children:
+            self.search(child, sample, k, best)
+
+
+class Approximation(NamedTuple):
+    """Recall/speed settings of RandomProjectionIndex: more tables or
+probing neighbouring buckets raise recall, more hashes per table or a
+narrower width shrink buckets and speed up queries.  limit stops the
+probing once that many candidates are gathered."""
+
+    tables: int = 12
+    hashes: int = 5
+    width: float = 1.5
+    probes: bool = True
+    seed: int = 0
+    limit: int | None = 100
+
+
+class RandomProjectionIndex(NeighbourIndex):
+    """Approximate neighbours by locality-sensitive hashing.
+
+    Each table projects a row onto hashes random Gaussian directions and
+    cuts every projection into width-sized slots; rows with the same
+    slots share a bucket.  A query gathers the rows of its own bucket
+    (and, with probes, of the buckets one slot away on any projection)
+    in every table and ranks only those by the exact distance.
+    """
+
+    def __init__(
+            self,
+            matrix: SampleMatrix,
+            algorithm: Distance,
+            settings: Approximation = Approximation(),
+    ) -> None:
+        super().__init__(matrix, algorithm)
+        self.settings = settings
+        rng = random.Random(settings.seed)
+        width = len(SampleMatrix.features)
+        # Each hash is its direction's components followed by its offset.
+        self.projections = [
+            [
+                (*(rng.gauss(0.0, 1.0) for _ in range(width)),
+                 rng.uniform(0.0, settings.width))
+                for _ in range(settings.hashes)
+            ]
+            for _ in range(settings.tables)
+        ]
+        self.buckets: list[dict[tuple[int, ...], list[int]]] = [
+            {} for _ in range(settings.tables)
+        ]
+        self.points: list[Sample] = []
+        self.add(range(len(matrix)))
+
+    def slots(
+            self, projections: list[tuple[float, ...]], point: Sample
+    ) -> list[float]:
+        """point's position along each projection, in slot widths."""
+        a, b, c, d = point
+        width = self.settings.width
+        return [
+            (p1 * a + p2 * b + p3 * c + p4 * d + offset) / width
+            for p1, p2, p3, p4, offset in projections
+        ]
+
+    def signature(
+            self, projections: list[tuple[float, ...]], point: Sample
+    ) -> tuple[int, ...]:
+        return tuple(map(math.floor, self.slots(projections, point)))
+
+    def add(self, rows: range) -> None:
+        columns = self.matrix.columns()
+        for row in rows:
+            point = Sample(*(column[row] for column in columns))
+            self.points.append(point)
+            for projections, buckets in zip(self.projections, self.buckets):
+                key = self.signature(projections, point)
+                buckets.setdefault(key, []).append(row)
+
+    @staticmethod
+    def probe(slots: list[float]) -> Iterator[tuple[int, ...]]:
+        """For each projection, the bucket one slot over on the side of
+        the nearer slot boundary."""
+        key = tuple(map(math.floor, slots))
+        for position, value in enumerate(slots):
+            step = -1 if value - key[position] < 0.5 else 1
+            yield key[:position] + (key[position] + step,) + key[position + 1 :]
+
+    def candidates(self, sample: Sample) -> set[int]:
+        """Rows sharing a bucket with sample in any table, then (with
+        probes) rows in the buckets next to those; gathering stops at the
+        first table that takes the count to limit."""
+        found: set[int] = set()
+        limit = self.settings.limit or math.inf
+        slots = [
+            self.slots(projections, sample) for projections in self.projections
+        ]
+        for values, buckets in zip(slots, self.buckets):
+            found.update(buckets.get(tuple(map(math.floor, values)), ()))
+            if len(found) >= limit:
+                return found
+        if self.settings.probes:
+            for values, buckets in zip(slots, self.buckets):
+                for near in self.probe(values):
+                    found.update(buckets.get(near, ()))
+                if len(found) >= limit:
+                    break
+        return found
+
+    def query(self, sample: Sample, k: int) -> list[int]:
+        """Falls back to the exact scan when the buckets hold fewer than k
+        candidates."""
+        candidates = sorted(self.candidates(sample))
+        if len(candidates) < k:
+            return self.exact(sample, k)
+        points = self.points
+        if self.algorithm.cache is None:
+            distances = self.algorithm.distances_to(
+                sample, map(points.__getitem__, candidates)
+            )
+        else:
+            distance, matrix = self.algorithm.cached, self.matrix
+            distances = [
+                distance(sample, matrix, row, points[row]) for row in candidates
+            ]
+        nearest = heapq.nsmallest(
+            k, range(len(candidates)), key=distances.__getitem__
+        )
+        return [candidates[i] for i in nearest]
+
+    def recall(self, samples: Iterable[Sample], k: int) -> float:
+        """Fraction of the exact k nearest that query finds."""
+        found = total = 0
+        for sample in samples:
+            truth = set(self.exact(sample, k))
+            found += len(truth.intersection(self.query(sample, k)))
+            total += len(truth)
+        return found / total if total else 1.0
+
+
+def vote(species: Sequence[str], nearest: Iterable[int]) -> str:
+    """Most common species among the nearest rows; ties go to the nearer."""
+    return Counter(species[i] for i in nearest).most_common(1)[0][0]
+
+
+class NeighbourTable:
+    """Nearest training rows of every testing sample, computed once for
+the largest k of a sweep so any smaller k is read off the front."""
+
+    def __init__(
+            self, index: NeighbourIndex, samples: Iterable[Sample], depth: int
+    ) -> None:
+        self.index = index
+        self.depth = depth
+        self.neighbours = [index.query(sample, depth) for sample in samples]
+
+    def classify(self, k: int) -> list[str]:
+        if k > self.depth:
+            raise ValueError(f"Table holds {self.depth} neighbours, not {k}")
+        species = self.index.matrix.species
+        return [vote(species, rows[:k]) for rows in self.neighbours]
+
 
 class Hyperparameter:
     """Конкретный набор параметров настройки с k и алгоритмом расстояния"""
@@ -210,10 +1558,62 @@ class Hyperparameter:
     k: int
     algorithm: Distance
     data: weakref.ReferenceType["TrainingData"]
+    approximate: Approximation | None
+
+    def __init__(
+            self,
+            k: int,
+            algorithm: Distance,
+            training: "TrainingData",
+            approximate: Approximation | None = None,
+    ) -> None:
+        self.k = k
+        self.algorithm = algorithm
+        self.data = weakref.ref(training)
+        self.approximate = approximate
+        self._index: NeighbourIndex | None = None
+
+    @property
+    def index(self) -> NeighbourIndex:
+        """The TrainingData's shared index for this configuration."""
+        if not (training_data := self.data()):
+            raise RuntimeError("Broken Weak Reference")
+        if self._index is None or self._index.matrix is not training_data.matrix:
+            self._index = training_data.index(
+                self.algorithm, self.k, self.approximate
+            )
+        return self._index
 
     def classify(self, sample: Sample) -> str:
         """Алгоритм k-NN"""
-        ...
+        return self.classify_many([sample])[0]
+
+    def classify_many(self, samples: Iterable[Sample]) -> list[str]:
+        """k-NN over the packed training matrix for a whole batch."""
+        index = self.index
+        species = index.matrix.species
+        return [vote(species, index.query(sample, self.k)) for sample in samples]
+
+    def test(self) -> float:
+        """Classify the testing partition, return the fraction correct."""
+        if not (training_data := self.data()):
+            raise RuntimeError("Broken Weak Reference")
+        testing = training_data.testing
+        if not testing:
+            return 0.0
+        table = training_data.neighbours(self.algorithm, self.k, self.approximate)
+        predicted = table.classify(self.k)
+        correct = 0
+        for t, species in zip(testing, predicted):
+            t.classification = species
+            correct += species == t.sample.species
+        return correct / len(testing)
+
+
+class LoadBatch(NamedTuple):
+    uploaded: datetime.datetime
+    training: int
+    testing: int
 
 
 class TrainingData:
@@ -224,13 +1624,669 @@ the samples."""
         self.name = name
         self.uploaded: datetime.datetime
         self.tested: datetime.datetime
-        self.training: list[Sample] = []
-        self.testing: list[Sample] = []
+        self.training: Sequence[TrainingKnowSample] = []
+        self.testing: Sequence[TestingKnowSample | SampleView] = []
         self.tuning: list[Hyperparameter] = []
+        self.partition: ShufflingSamplePartition | None = None
+        self.batches: list[LoadBatch] = []
+        self._matrix: SampleMatrix | None = None
+        self._indexes: dict[
+            tuple[type[Distance], bool | Approximation], NeighbourIndex
+        ] = {}
+        self._neighbours: dict[
+            tuple[type[Distance], Approximation | None], NeighbourTable
+        ] = {}
 
     def load(
             self,
-            raw_data_source: Iterable[dict[str, str]]
+            raw_data_source: Iterable[dict[str, str]] | SampleCache,
+            *,
+            training_subset: float = 0.80,
+            compact: bool = False,
+    ) -> None:
+        """Load and partition the raw data.
+
+        With compact, both partitions are kept in a SampleStore rather
+        than as per-row objects.  A SampleCache is mapped rather than
+        parsed: its rows are stored shuffled, so both partitions are
+        views into the mapping, which stays open as long as they do.
+        """
+        if isinstance(raw_data_source, SampleCache):
+            self.load_matrix(raw_data_source.open(), training_subset)
+            return
+        if compact:
+            self.load_compact(raw_data_source, training_subset)
+            return
+        partition = ShufflingSamplePartition(
+            map(sample_dict, raw_data_source), training_subset=training_subset
+        )
+        self.partition = partition
+        self.training = partition.training
+        # Testing samples carry their classification, so they are built once.
+        self.testing = list(partition.testing)
+        self._matrix = None
+        self._indexes = {}
+        self._neighbours = {}
+        self.stamp(len(self.training), len(self.testing), reset=True)
+
+    def load_compact(
+            self, raw_data_source: Iterable[dict[str, str]], training_subset: float
+    ) -> None:
+        """Parse rows straight into one SampleStore, then gather the
+        partition's training and testing row numbers into a store each."""
+        rows = SampleStore()
+        for row in raw_data_source:
+            rows.append_row(sample_dict(row))
+        self.partition = ShufflingSamplePartition(training_subset=training_subset)
+        training_rows, testing_rows = self.partition.permute(
+            EncodedSpecies(rows.species, rows.names)
+        )
+        self.training = rows.take(training_rows)
+        self.testing = rows.take(testing_rows)
+        self._matrix = None
+        self._indexes = {}
+        self._neighbours = {}
+        self.stamp(len(self.training), len(self.testing), reset=True)
+
+    def load_matrix(self, matrix: SampleMatrix, training_subset: float) -> None:
+        """Partition a matrix whose rows are already in shuffled order, as
+        a SampleCache's are, by cutting it in two without copying;
+        testing samples are built as they are first read."""
+        self.partition = ShufflingSamplePartition(training_subset=training_subset)
+        split = int(len(matrix) * training_subset)
+        self._matrix = matrix.slice(0, split)
+        self._indexes = {}
+        self._neighbours = {}
+        self.training = TrainingRows(self._matrix)
+        self.testing = TestingRows(matrix.slice(split, len(matrix)))
+        self.stamp(len(self.training), len(self.testing), reset=True)
+
+    def stamp(self, training: int, testing: int, reset: bool = False) -> None:
+        self.uploaded = datetime.datetime.now(tz=datetime.timezone.utc)
+        batch = LoadBatch(self.uploaded, training, testing)
+        self.batches = [batch] if reset else self.batches + [batch]
+
+    def append(self, raw_data_source: Iterable[dict[str, str]]) -> LoadBatch:
+        """Add labelled rows without reloading.
+
+        New rows are split by the partition's training_subset; the
+        training matrix and every index already built over it are
+        extended in place, cached neighbour tables are dropped.  If any
+        step fails (a bad row, an index update) the rows are taken out
+        again and the indexes dropped, to be rebuilt when next used.
+        """
+        if self.partition is None:
+            self.load(raw_data_source)
+            return self.batches[-1]
+        partition = self.partition
+        partition.shuffle()
+        sizes = (
+            len(partition), len(partition.training_rows),
+            len(partition.testing_rows), len(self.training), len(self.testing),
+            None if self._matrix is None else len(self._matrix),
+        )
+        try:
+            _, training_rows, testing_rows = partition.add(
+                map(sample_dict, raw_data_source)
+            )
+            training = [known_sample(partition[row]) for row in training_rows]
+            testing = [known_sample(partition[row]) for row in testing_rows]
+
+            # PartitionView and TrainingRows see the new rows by themselves.
+            if isinstance(self.training, SampleStore):
+                self.training.extend(training)
+            elif isinstance(self.training, list):
+                self.training.extend(TrainingKnowSample(k) for k in training)
+            if isinstance(self.testing, (SampleStore, TestingRows)):
+                self.testing.extend(testing)
+            else:
+                self.testing.extend(TestingKnowSample(k) for k in testing)  # type: ignore[union-attr]
+
+            if self._matrix is not None:
+                start = len(self._matrix)
+                self._matrix.extend(training)
+                for index in self._indexes.values():
+                    index.add(range(start, len(self._matrix)))
+        except BaseException:
+            self.truncate(*sizes)
+            raise
+        self._neighbours = {}
+        self.stamp(len(training), len(testing))
+        return self.batches[-1]
+
+    def truncate(
+            self, rows: int, training_rows: int, testing_rows: int,
+            training: int, testing: int, matrix: int | None,
+    ) -> None:
+        """Undo a failed append(), given the sizes from before it."""
+        assert self.partition is not None
+        del self.partition[rows:]
+        del self.partition.training_rows[training_rows:]
+        del self.partition.testing_rows[testing_rows:]
+        self.partition.split = len(self.partition.training_rows)
+        for part, size in ((self.training, training), (self.testing, testing)):
+            if isinstance(part, (SampleStore, TestingRows)):
+                part.truncate(size)
+            elif isinstance(part, list):
+                del part[size:]
+        if self._matrix is not None and matrix is not None:
+            self._matrix.truncate(matrix)
+        self._indexes = {}
+
+    @property
+    def matrix(self) -> SampleMatrix:
+        """Training partition packed once and shared by every Hyperparameter."""
+        if self._matrix is None:
+            if isinstance(self.training, SampleStore):
+                self._matrix = self.training.matrix()
+            else:
+                self._matrix = SampleMatrix.from_known(
+                    t.sample for t in self.training
+                )
+        return self._matrix
+
+    #: Below this many training rows a tree costs more than it saves.
+    index_min_rows = 2_000
+    #: With k this large a fraction of N, most leaves get visited anyway.
+    index_max_k_fraction = 0.05
+
+    def use_tree(self, k: int) -> bool:
+        rows = len(self.matrix)
+        return (
+            rows >= self.index_min_rows
+            and k <= rows * self.index_max_k_fraction
+        )
+
+    def index(
+            self,
+            algorithm: Distance,
+            k: int,
+            approximate: Approximation | None = None,
+    ) -> NeighbourIndex:
+        """Build (once) and return the neighbour index for an algorithm:
+a KD-tree for ED, a ball tree for other metrics, brute force otherwise,
+or a RandomProjectionIndex when approximate settings are given."""
+        if approximate is not None:
+            key: tuple[type[Distance], bool | Approximation] = (
+                type(algorithm), approximate
+            )
+            if key not in self._indexes:
+                self._indexes[key] = RandomProjectionIndex(
+                    self.matrix, algorithm, approximate
+                )
+            return self._indexes[key]
+        tree = self.use_tree(k) and algorithm.metric
+        key = (type(algorithm), tree)
+        if key not in self._indexes:
+            if not tree:
+                index_class: type[NeighbourIndex] = BruteForceIndex
+            elif isinstance(algorithm, ED):
+                index_class = KDTreeIndex
+            else:
+                index_class = BallTreeIndex
+            self._indexes[key] = index_class(self.matrix, algorithm)
+        return self._indexes[key]
+
+    def neighbours(
+            self,
+            algorithm: Distance,
+            depth: int,
+            approximate: Approximation | None = None,
+    ) -> NeighbourTable:
+        """The testing partition's neighbour table for an algorithm, kept
+until a deeper one is asked for or the data changes."""
+        key = (type(algorithm), approximate)
+        table = self._neighbours.get(key)
+        if (
+            table is None
+            or table.depth < depth
+            or table.index.matrix is not self.matrix
+            or len(table.neighbours) != len(self.testing)
+        ):
+            table = NeighbourTable(
+                self.index(algorithm, depth, approximate),
+                (t.sample.sample for t in self.testing),
+                depth,
+            )
+            self._neighbours[key] = table
+        return table
+
+    def test(self, parameter: Hyperparameter) -> float:
+        accuracy = parameter.test()
+        self.tested = datetime.datetime.now(tz=datetime.timezone.utc)
+        return accuracy
+
+
+class TuningResult(NamedTuple):
+    k: int
+    algorithm: str
+    accuracy: float
+    seconds: float
+
+
+class SharedSamples(NamedTuple):
+    """What a worker needs to attach to the shared training/testing data
+    and the neighbour tables it fills in."""
+
+    features: str
+    labels: str
+    tables: str
+    training_rows: int
+    testing_rows: int
+    species: list[str]
+
+
+#: Per-process training data, testing matrix and neighbour tables over
+#: shared memory, set up by _attach.
+_shared: tuple[
+    TrainingData, SampleMatrix, memoryview, list[shared_memory.SharedMemory]
+] | None = None
+
+
+def _attach(shared: SharedSamples) -> None:
+    global _shared
+    blocks = [
+        shared_memory.SharedMemory(name=name)
+        for name in (shared.features, shared.labels, shared.tables)
+    ]
+    features = blocks[0].buf.cast("d")
+    labels = blocks[1].buf.cast("H")
+    split = shared.training_rows * len(SampleMatrix.features)
+    training = SampleMatrix(
+        features[:split],
+        EncodedSpecies(labels[: shared.training_rows], shared.species),
+    )
+    testing = SampleMatrix(
+        features[split:],
+        EncodedSpecies(labels[shared.training_rows :], shared.species),
+    )
+    training_data = TrainingData("shared")
+    training_data._matrix = training
+    _shared = (training_data, testing, blocks[2].buf.cast("I"), blocks)
+
+
+def _neighbours(
+        algorithm: type[Distance], depth: int, offset: int, start: int, stop: int,
+) -> None:
+    """Fill in the neighbour table rows of testing rows start:stop, the
+    table for algorithm starting offset entries into the shared block."""
+    assert _shared is not None, "worker was not attached"
+    training_data, testing, tables, _ = _shared
+    index = training_data.index(algorithm(), depth)
+    position = offset + start * depth
+    for sample in testing.slice(start, stop).rows():
+        tables[position : position + depth] = array("I", index.query(sample, depth))
+        position += depth
+
+
+class Tuner:
+    """Evaluates (k, Distance subclass) pairs against the testing partition.
+
+    run() copies the packed training and testing features and species
+    codes into shared memory once.  The pool then fills in one neighbour
+    table per algorithm, deep enough for its largest k and split by
+    testing rows across the workers; that is nearly all of the work, and
+    every k is then scored off the shared table in this process.  The
+    tables cost what run_serial() spends on them, so run() only wins
+    with more than one core to spread them over.
+    """
+
+    def __init__(
+            self, training_data: TrainingData, workers: int | None = None
     ) -> None:
-        """Load and partition the raw data."""
-        self.uploaded = datetime.datetime.now(tz=datetime.timezone.utc)
\ No newline at end of file
+        self.training_data = training_data
+        self.workers = workers
+
+    @staticmethod
+    def grid(
+            ks: Iterable[int], algorithms: Iterable[type[Distance]]
+    ) -> list[tuple[int, type[Distance]]]:
+        return list(itertools.product(ks, algorithms))
+
+    def parameters(
+            self, grid: Iterable[tuple[int, type[Distance]]] | None
+    ) -> list[tuple[int, type[Distance]]]:
+        if grid is None:
+            return [(h.k, type(h.algorithm)) for h in self.training_data.tuning]
+        return list(grid)
+
+    @staticmethod
+    def depths(
+            parameters: list[tuple[int, type[Distance]]]
+    ) -> dict[type[Distance], int]:
+        """Largest k per algorithm: one neighbour table serves the rest."""
+        depth: dict[type[Distance], int] = {}
+        for k, algorithm in parameters:
+            depth[algorithm] = max(k, depth.get(algorithm, 0))
+        return depth
+
+    def run_serial(
+            self, grid: Iterable[tuple[int, type[Distance]]] | None = None
+    ) -> Iterator[TuningResult]:
+        parameters = self.parameters(grid)
+        depth = self.depths(parameters)
+        for k, algorithm in parameters:
+            start = time.perf_counter()
+            self.training_data.neighbours(algorithm(), depth[algorithm])
+            accuracy = Hyperparameter(k, algorithm(), self.training_data).test()
+            yield TuningResult(
+                k, algorithm.__name__, accuracy, time.perf_counter() - start
+            )
+
+    def testing_matrix(self) -> SampleMatrix:
+        testing = self.training_data.testing
+        if isinstance(testing, TestingRows):
+            return testing.matrix
+        if isinstance(testing, SampleStore):
+            return testing.matrix()
+        return SampleMatrix.from_known(t.sample for t in testing)
+
+    def share(
+            self, table_size: int
+    ) -> tuple[SharedSamples, list[shared_memory.SharedMemory]]:
+        """Shared features, species codes and room for table_size
+        neighbour table entries."""
+        training = self.training_data.matrix
+        testing = self.testing_matrix()
+        names = sorted(set(training.species) | set(testing.species))
+        codes = {name: code for code, name in enumerate(names)}
+        labels = array("H", (codes[s] for s in training.species))
+        labels.extend(codes[s] for s in testing.species)
+        features = array("d")
+        for matrix in (training, testing):
+            for column in matrix.columns():
+                features.extend(column)
+
+        blocks = []
+        for values in (features, labels):
+            raw = memoryview(values).cast("B")
+            block = shared_memory.SharedMemory(create=True, size=max(len(raw), 1))
+            block.buf[: len(raw)] = raw
+            blocks.append(block)
+        size = table_size * array("I").itemsize
+        blocks.append(shared_memory.SharedMemory(create=True, size=max(size, 1)))
+        shared = SharedSamples(
+            blocks[0].name, blocks[1].name, blocks[2].name,
+            len(training), len(testing), names,
+        )
+        return shared, blocks
+
+    def run(
+            self, grid: Iterable[tuple[int, type[Distance]]] | None = None
+    ) -> Iterator[TuningResult]:
+        """Yield the results of an algorithm as soon as its table is done.
+
+        TuningResult.seconds is then only the time to score that k.
+        """
+        parameters = self.parameters(grid)
+        training_rows = len(self.training_data.matrix)
+        depth = {
+            algorithm: min(k, training_rows)
+            for algorithm, k in self.depths(parameters).items()
+        }
+        testing_rows = len(self.training_data.testing)
+        offsets, size = {}, 0
+        for algorithm, d in depth.items():
+            offsets[algorithm], size = size, size + testing_rows * d
+        shared, blocks = self.share(size)
+        try:
+            workers = self.workers or os.cpu_count() or 1
+            with ProcessPoolExecutor(
+                workers, initializer=_attach, initargs=(shared,)
+            ) as pool:
+                chunk = -(-testing_rows // workers) or 1
+                jobs = {
+                    pool.submit(
+                        _neighbours, algorithm, d, offsets[algorithm],
+                        start, min(start + chunk, testing_rows),
+                    ): algorithm
+                    for algorithm, d in depth.items()
+                    for start in range(0, testing_rows, chunk)
+                }
+                pending = Counter(jobs.values())
+                tables = blocks[2].buf.cast("I")
+                labels = blocks[1].buf.cast("H")
+                try:
+                    for job in as_completed(jobs):
+                        job.result()
+                        algorithm = jobs[job]
+                        pending[algorithm] -= 1
+                        if pending[algorithm]:
+                            continue
+                        for k, a in parameters:
+                            if a is algorithm:
+                                yield self.score(
+                                    k, algorithm, tables, offsets[algorithm],
+                                    depth[algorithm], labels, shared,
+                                )
+                finally:
+                    tables.release()
+                    labels.release()
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    @staticmethod
+    def score(
+            k: int, algorithm: type[Distance], tables: memoryview, offset: int,
+            depth: int, labels: memoryview, shared: SharedSamples,
+    ) -> TuningResult:
+        """Accuracy of k off an algorithm's shared neighbour table."""
+        start = time.perf_counter()
+        training = EncodedSpecies(labels[: shared.training_rows], shared.species)
+        testing = labels[shared.training_rows :]
+        correct = 0
+        for row, expected in enumerate(testing):
+            position = offset + row * depth
+            nearest = tables[position : position + k]
+            correct += vote(training, nearest) == shared.species[expected]
+        accuracy = correct / len(testing) if len(testing) else 0.0
+        return TuningResult(
+            k, algorithm.__name__, accuracy, time.perf_counter() - start
+        )
+
+
+def reference_classify(
+        k: int, algorithm: Distance,
+        training: list[KnowSample], sample: Sample,
+) -> str:
+    """Pure-Python k-NN: one Distance.distance call per pair."""
+    distances = sorted(
+        (algorithm.distance(sample, known.sample), known.species)
+        for known in training
+    )
+    votes = Counter(species for _, species in distances[:k])
+    return votes.most_common(1)[0][0]
+
+
+def random_known(count: int, seed: int = 42) -> list[KnowSample]:
+    rng = random.Random(seed)
+    return [
+        KnowSample(
+            Sample(*(rng.uniform(0.0, 8.0) for _ in range(4))),
+            rng.choice(("setosa", "versicolor", "virginica")),
+        )
+        for _ in range(count)
+    ]
+
+
+def benchmark(queries: int = 100, rows: int = 10_000, k: int = 5) -> None:
+    """Compare the batch engine with reference_classify.
+
+    The full 10k x 100k comparison is ``benchmark(10_000, 100_000)``;
+    the reference side of it runs for hours, hence the smaller default.
+    """
+    training = random_known(rows)
+    samples = [known.sample for known in random_known(queries, seed=7)]
+    data = TrainingData("benchmark")
+    data.training = [TrainingKnowSample(known) for known in training]
+    parameter = Hyperparameter(k, ED(), data)
+
+    start = time.perf_counter()
+    fast = parameter.classify_many(samples)
+    engine = time.perf_counter() - start
+
+    start = time.perf_counter()
+    slow = [reference_classify(k, ED(), training, s) for s in samples]
+    reference = time.perf_counter() - start
+
+    agree = sum(a == b for a, b in zip(fast, slow)) / queries
+    print(f"{queries} x {rows}: engine {engine:.3f}s, "
+          f"reference {reference:.3f}s, x{reference / engine:.1f}, "
+          f"agreement {agree:.1%}")
+
+
+def benchmark_tuning(
+        rows: int = 2_000, ks: Iterable[int] = range(1, 11),
+        workers: int | None = None,
+) -> None:
+    """Serial against parallel Tuner on a k x {ED, MD, CD} grid.
+
+    Both compute the same three neighbour tables, so parallel can only
+    win with several cores: on one core it pays the pool start-up on
+    top (x0.9 at 10_000 rows, x0.7 at 1_500).  Give it rows enough for
+    the tables to outweigh that start-up, e.g. 10_000 and up.
+    """
+    training_data = TrainingData("benchmark")
+    known = random_known(rows)
+    split = int(rows * 0.8)
+    training_data.training = [TrainingKnowSample(s) for s in known[:split]]
+    training_data.testing = [TestingKnowSample(s) for s in known[split:]]
+    grid = Tuner.grid(ks, (ED, MD, CD))
+    tuner = Tuner(training_data, workers)
+
+    start = time.perf_counter()
+    list(tuner.run_serial(grid))
+    serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    list(tuner.run(grid))
+    parallel = time.perf_counter() - start
+
+    print(f"{len(grid)} jobs on {os.cpu_count()} core(s): serial {serial:.2f}s, "
+          f"parallel {parallel:.2f}s, x{serial / parallel:.1f}")
+
+
+def benchmark_reader(path: Path, rows: int = 1_000_000) -> None:
+    """Rows/sec for csv.DictReader, sample_iter and chunk_iter."""
+    known = random_known(rows)
+    with path.open("w") as target:
+        for s in known:
+            target.write(",".join(map(str, (*s.sample, s.species))) + "\n")
+    reader = SampleReader(path)
+
+    def dict_reader() -> int:
+        with path.open() as source:
+            return sum(
+                1 for row in csv.DictReader(source, SampleReader.header)
+                if Sample(*(float(row[h]) for h in SampleReader.header[:4]))
+            )
+
+    for name, count in (
+        ("csv.DictReader", dict_reader),
+        ("sample_iter", lambda: sum(1 for _ in reader.sample_iter())),
+        ("chunk_iter", lambda: sum(len(c) for c in reader.chunk_iter())),
+    ):
+        start = time.perf_counter()
+        total = count()
+        seconds = time.perf_counter() - start
+        print(f"{name:>15}: {total / seconds:,.0f} rows/sec")
+
+
+def benchmark_cache(path: Path, rows: int = 1_000_000) -> None:
+    """Cold CSV parse against a warm SampleCache open."""
+    known = random_known(rows)
+    with path.open("w") as target:
+        for s in known:
+            target.write(",".join(map(str, (*s.sample, s.species))) + "\n")
+    cache = SampleCache(path.with_suffix(f"{path.suffix}.samples"))
+
+    start = time.perf_counter()
+    cache.write(path)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    training_data = TrainingData("benchmark")
+    training_data.load(SampleCache.for_source(path, cache.path))
+    warm = time.perf_counter() - start
+    print(f"{rows} rows: parse and write {cold:.2f}s, warm load {warm:.4f}s")
+
+
+def benchmark_memory(rows: int = 100_000) -> None:
+    """Bytes per sample: TrainingKnowSample objects against a SampleStore."""
+    known = random_known(rows)
+
+    tracemalloc.start()
+    # v + 0.0 gives each row its own float objects, as a parser would.
+    objects = [
+        TrainingKnowSample(
+            KnowSample(Sample(*(v + 0.0 for v in k.sample)), k.species)
+        )
+        for k in known
+    ]
+    before = tracemalloc.get_traced_memory()[0]
+    del objects
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    store = SampleStore.from_known(known)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{rows} samples: objects {before / rows:.0f} bytes/sample, "
+          f"SampleStore {after / rows:.0f} bytes/sample "
+          f"({store.nbytes() / rows:.0f} in arrays)")
+
+
+def benchmark_append(rows: int = 100_000, batch: int = 10_000) -> None:
+    """Latency of append() for one batch against a full reload."""
+    raw = [
+        dict(zip(SampleDict.__annotations__, map(str, (*k.sample, k.species))))
+        for k in random_known(rows + batch)
+    ]
+    training_data = TrainingData("benchmark")
+    training_data.load(raw[:rows])
+    Hyperparameter(5, ED(), training_data).index
+
+    start = time.perf_counter()
+    training_data.append(raw[rows:])
+    append = time.perf_counter() - start
+
+    start = time.perf_counter()
+    training_data.load(raw)
+    Hyperparameter(5, ED(), training_data).index
+    reload = time.perf_counter() - start
+    print(f"{batch} rows onto {rows}: append {append:.3f}s, "
+          f"reload {reload:.3f}s")
+
+
+def benchmark_approximate(
+        rows: int = 20_000, queries: int = 200, k: int = 5,
+        settings: Iterable[Approximation] = (
+            Approximation(8, 4, 1.5), Approximation(),
+            Approximation(limit=150), Approximation(limit=None),
+        ),
+) -> None:
+    """Query time and recall of RandomProjectionIndex against the exact
+KD-tree for ED.  The index pays off as rows grow: the tree's cost keeps
+rising while limit caps the candidates, so try rows=100_000 too."""
+    matrix = SampleMatrix.from_known(random_known(rows))
+    samples = [known.sample for known in random_known(queries, seed=7)]
+    exact = KDTreeIndex(matrix, ED())
+    start = time.perf_counter()
+    for sample in samples:
+        exact.query(sample, k)
+    print(f"{'exact':>36}: {(time.perf_counter() - start) / queries * 1e3:.3f}ms")
+    for setting in settings:
+        index = RandomProjectionIndex(matrix, ED(), setting)
+        start = time.perf_counter()
+        for sample in samples:
+            index.query(sample, k)
+        seconds = time.perf_counter() - start
+        print(f"{setting!s:>36}: {seconds / queries * 1e3:.3f}ms, "
+              f"recall {index.recall(samples, k):.1%}")
+
+
+if __name__ == "__main__":
+    benchmark()
+    benchmark_tuning()
@@ -1,43 +1,522 @@
 import abc
+import argparse
+import asyncio
+import codecs
+import collections
+from collections import Counter
+import contextlib
+import copy
+import cProfile
+import datetime
+import glob
+import hashlib
+import heapq
+import io
+import json
+import mmap
+import os
+import pstats
+from concurrent.futures import (
+    FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait,
+)
 from pathlib import Path
+import struct
+import tempfile
+import threading
+import time
+import types
+from typing import Any, Callable, Iterable, Iterator, NamedTuple
 import zipfile
+import zlib
 import fnmatch
 import re
 
+from audiofile import AudioFile
+
 
 class ZipProcessor(abc.ABC):
-    def __init__(self, archive: Path) -> None:
+    #: Bytes read from a member per step in streaming mode.
+    chunkSize = 1024 * 1024
+    #: Batch runs silence the per-member messages.
+    quiet = False
+
+    def __init__(
+            self, archive: Path, streaming: bool = False, workers: int = 1,
+            cache: "TransformCache | None" = None,
+    ) -> None:
         self.archivePath = archive
+        self.streaming = streaming
+        self.workers = workers
+        self.cache = cache
+        self.sinks: list[Sink] = []
+        self.compression: CompressionPolicy | None = None
         self._pattern: str
+        self._item: zipfile.ZipInfo
+
+    def processFiles(self, pattern: str = "*") -> bool:
+        """With a cache, members are streamed (a cached result is copied
+        in place of re-running the transform) and an archive where the
+        cache says nothing would change is left alone entirely.
+
+        The rewrite goes to a .new file that replaces the archive, the
+        original kept as .old, only once it is complete; after a failure
+        the archive is left as it was.
 
-    def processFiles(self, pattern: str) -> None:
+        Returns whether the archive was rewritten.
+        """
         self._pattern = pattern
 
-        inputPath, outputPath = self.makeBackup()
+        if self.cache is not None:
+            self.cache.hits = self.cache.misses = 0
+        if (
+            self.cache is not None and self.compression is None
+            and self.nothingChanges()
+        ):
+            self.report(f"Unchanged {self.archivePath}")
+            self.report(self.summary())
+            return False
 
-        with zipfile.ZipFile(outputPath, "w") as output:
-            with zipfile.ZipFile(inputPath) as input:
-                self.copyAndTransform(input, output)
-    
-    def makeBackup(self) -> tuple[Path, Path]:
-        inputPath = self.archivePath.with_suffix(
-            f"{self.archivePath.suffix}.old")
-        outputPath = self.archivePath
-        self.archivePath.rename(inputPath)
-        return inputPath, outputPath
+        outputPath = self.pendingPath()
+        try:
+            with zipfile.ZipFile(outputPath, "w") as output:
+                with zipfile.ZipFile(self.archivePath) as input:
+                    if self.workers > 1:
+                        self.parallelTransform(input, output)
+                    elif self.streaming or self.cache is not None:
+                        self.streamAndTransform(input, output)
+                    else:
+                        self.copyAndTransform(input, output)
+        except BaseException:
+            outputPath.unlink(missing_ok=True)
+            raise
+        self.makeBackup(outputPath)
+        if summary := self.summary():
+            self.report(summary)
+        return True
+
+    async def processFilesAsync(self, pattern: str = "*", depth: int = 8) -> bool:
+        """processFiles() as a coroutine that leaves the event loop free.
+
+        Members go through an AsyncPipeline: reading and decompressing,
+        transforming and compressing and writing overlap, with at most
+        depth chunks (or, with workers > 1, members) queued between
+        stages.  Matched members are always streamed, as with streaming.
+        """
+        self._pattern = pattern
+
+        if self.cache is not None:
+            self.cache.hits = self.cache.misses = 0
+        if (
+            self.cache is not None and self.compression is None
+            and await asyncio.to_thread(self.nothingChanges)
+        ):
+            self.report(f"Unchanged {self.archivePath}")
+            self.report(self.summary())
+            return False
+
+        outputPath = self.pendingPath()
+        try:
+            with contextlib.ExitStack() as stack:
+                input = stack.enter_context(
+                    await asyncio.to_thread(zipfile.ZipFile, self.archivePath)
+                )
+                # The writer copies raw bytes through a handle of its own,
+                # so its seeks never interleave with the reader's.
+                rawInput = stack.enter_context(
+                    await asyncio.to_thread(zipfile.ZipFile, self.archivePath)
+                )
+                output = await asyncio.to_thread(zipfile.ZipFile, outputPath, "w")
+                try:
+                    await AsyncPipeline(self, input, rawInput, output, depth).run()
+                finally:
+                    await asyncio.to_thread(output.close)
+        except BaseException:
+            outputPath.unlink(missing_ok=True)
+            raise
+        await asyncio.to_thread(self.makeBackup, outputPath)
+        if summary := self.summary():
+            self.report(summary)
+        return True
+
+    def report(self, message: str) -> None:
+        if not self.quiet:
+            print(message)
+
+    def compressWith(self, policy: "CompressionPolicy") -> "ZipProcessor":
+        """Choose each member's output compression by policy instead of
+        keeping the input's.  Members are then always rewritten, even
+        where a cache says the transform changes nothing."""
+        self.compression = policy
+        return self
+
+    def compressionFor(
+            self, input: zipfile.ZipFile, item: zipfile.ZipInfo,
+    ) -> "Compression | None":
+        """What the policy wants item written as; None to keep it."""
+        if self.compression is None or item.is_dir():
+            return None
+        return self.compression.choose(
+            item, lambda: sampleMember(input, item, self.compression.sampleSize)  # type: ignore[union-attr]
+        )
+
+    def targetInfo(
+            self, input: zipfile.ZipFile, item: zipfile.ZipInfo,
+    ) -> zipfile.ZipInfo:
+        """outputInfo(item), compressed the way the policy wants."""
+        info = outputInfo(item)
+        if compression := self.compressionFor(input, item):
+            info.compress_type = compression.method
+            info._compresslevel = compression.level  # type: ignore[attr-defined]
+        return info
+
+    def copyMember(
+            self, input: zipfile.ZipFile, output: zipfile.ZipFile,
+            item: zipfile.ZipInfo,
+    ) -> None:
+        """Copy item untransformed: raw, unless the policy recompresses it."""
+        compression = self.compressionFor(input, item)
+        if compression is None or (
+            compression.method == item.compress_type and compression.level is None
+        ):
+            copyRaw(input, output, item)
+            return
+        info = outputInfo(item)
+        info.compress_type = compression.method
+        info._compresslevel = compression.level  # type: ignore[attr-defined]
+        with input.open(item) as source, output.open(
+            info, "w", force_zip64=item.file_size >= zipfile.ZIP64_LIMIT // 2
+        ) as target:
+            for chunk in iter(lambda: source.read(self.chunkSize), b""):
+                target.write(chunk)
+
+    def lookup(self, key: str, item: zipfile.ZipInfo) -> "CacheEntry | None":
+        """cache.lookup(); under a compression policy, which is part of
+        the key, the entry need not be compressed as item is."""
+        assert self.cache is not None
+        return self.cache.lookup(key, item, strict=self.compression is None)
+
+    def instrument(self, *sinks: "Sink") -> "ZipProcessor":
+        """Send a MemberEvent for every member written to sinks."""
+        self.sinks.extend(sinks)
+        return self
+
+    def profiling(self, item: zipfile.ZipInfo) -> contextlib.ExitStack:
+        """The sinks' profile() contexts for transforming item."""
+        stack = contextlib.ExitStack()
+        for sink in self.sinks:
+            stack.enter_context(sink.profile(str(self.archivePath), item.filename))
+        return stack
+
+    def matchCount(self) -> int:
+        """Matches found so far, for MemberEvent.matches; 0 if the
+        processor does not count them."""
+        return 0
+
+    def emit(
+            self, output: zipfile.ZipFile, item: zipfile.ZipInfo, action: str,
+            clock: Counter[str], matches: int,
+    ) -> None:
+        """Report item, just written to output, to the sinks."""
+        if not self.sinks:
+            return
+        written = output.NameToInfo[item.filename]
+        event = MemberEvent(
+            str(self.archivePath), item.filename, action,
+            item.compress_size, written.compress_size,
+            item.file_size, written.file_size,
+            clock["decompress"], clock["transform"], clock["compress"],
+            clock["filesystem"], matches,
+        )
+        for sink in self.sinks:
+            sink.event(event)
+
+    def summary(self) -> str:
+        return "" if self.cache is None else self.cache.summary()
+
+    def transformKey(self) -> str | None:
+        """Identity of what transform() does, parameters included, for the
+        TransformCache; None means the result must not be cached."""
+        return None
+
+    def cacheKey(self, item: zipfile.ZipInfo) -> str | None:
+        if self.cache is None or (transform := self.transformKey()) is None:
+            return None
+        if self.compression is not None:
+            transform += self.compression.key()
+        return self.cache.key(item, transform)
+
+    def nothingChanges(self) -> bool:
+        assert self.cache is not None
+        with zipfile.ZipFile(self.archivePath) as input:
+            for item in input.infolist():
+                if not self.matches(item):
+                    continue
+                key = self.cacheKey(item)
+                entry = None if key is None else self.lookup(key, item)
+                if entry is None or not entry.unchanged:
+                    # The members get looked up again during the rewrite.
+                    self.cache.hits = self.cache.misses = 0
+                    return False
+        return True
+
+    def writeCached(
+            self, input: zipfile.ZipFile, output: zipfile.ZipFile,
+            item: zipfile.ZipInfo, key: str | None,
+    ) -> bool:
+        """Write item from the cache if it has it; False on a miss."""
+        if key is None or self.cache is None:
+            return False
+        entry = self.lookup(key, item)
+        if entry is None:
+            return False
+        self.writeEntry(input, output, item, key, entry)
+        return True
+
+    def writeEntry(
+            self, input: zipfile.ZipFile, output: zipfile.ZipFile,
+            item: zipfile.ZipInfo, key: str, entry: "CacheEntry",
+    ) -> None:
+        assert self.cache is not None
+        if entry.unchanged:
+            self.copyMember(input, output, item)
+            return
+        info = outputInfo(item)
+        info.compress_type = entry.compressType
+        info.CRC, info.file_size = entry.crc, entry.size
+        info.compress_size = entry.compressSize
+        if info.compress_type == zipfile.ZIP_LZMA:
+            info.flag_bits |= zipfile._MASK_COMPRESS_OPTION_1
+        with self.cache.data(key).open("rb") as source:
+            writeRaw(output, info, source, entry.compressSize)
+
+    def remember(
+            self, output: zipfile.ZipFile, item: zipfile.ZipInfo,
+            key: str | None,
+    ) -> None:
+        """Store what was just written for item in the cache."""
+        if key is None or self.cache is None:
+            return
+        info = output.NameToInfo[item.filename]
+        if info.CRC == item.CRC and info.file_size == item.file_size:
+            self.cache.put(key, CacheEntry(True, info.CRC, info.file_size, 0, info.compress_type))
+            return
+        with output._lock:
+            seekData(output.fp, info.header_offset)
+            self.cache.put(
+                key,
+                CacheEntry(
+                    False, info.CRC, info.file_size, info.compress_size,
+                    info.compress_type,
+                ),
+                output.fp,
+            )
+            output.fp.seek(output.start_dir)
+
+    def pendingPath(self) -> Path:
+        """Where a rewrite of the archive is written until it is complete."""
+        return self.archivePath.with_suffix(f"{self.archivePath.suffix}.new")
+
+    def makeBackup(self, outputPath: Path) -> None:
+        """Keep the original as .old and put the complete outputPath in
+        its place."""
+        self.archivePath.replace(
+            self.archivePath.with_suffix(f"{self.archivePath.suffix}.old")
+        )
+        outputPath.replace(self.archivePath)
     
     def copyAndTransform(
             self, input: zipfile.ZipFile, output: zipfile.ZipFile,
     ) -> None:
         for item in input.infolist():
-            extracted = Path(input.extract(item))
+            clock: Counter[str] = Counter()
+            before = self.matchCount()
+            with timer(clock, "decompress"):
+                extracted = Path(input.extract(item))
             if self.matches(item):
-                print(f"Transform {item}")
-                self.transform(extracted)
+                self.report(f"Transform {item}")
+                self._item = item
+                with timer(clock, "transform"), self.profiling(item):
+                    self.transform(extracted)
+                action = "transform"
             else:
-                print(f"Ignore {item}")
-            output.write(extracted, item.filename)
-            self.removeUnderCWD(extracted)
+                self.report(f"Ignore {item}")
+                action = "ignore"
+            with timer(clock, "compress"):
+                if self.compression is None:
+                    output.write(extracted, item.filename)
+                else:
+                    info = self.targetInfo(input, item)
+                    output.write(
+                        extracted, item.filename, info.compress_type,
+                        info._compresslevel,  # type: ignore[attr-defined]
+                    )
+            with timer(clock, "filesystem"):
+                self.removeUnderCWD(extracted)
+            self.emit(
+                output, item, action, clock, self.matchCount() - before
+            )
+
+    def streamAndTransform(
+            self, input: zipfile.ZipFile, output: zipfile.ZipFile,
+    ) -> None:
+        """Like copyAndTransform, but nothing touches the working directory:
+        matched members are streamed through transformChunks and the rest
+        are copied still compressed."""
+        for item in input.infolist():
+            clock: Counter[str] = Counter()
+            before = self.matchCount()
+            if self.matches(item):
+                key = self.cacheKey(item)
+                with timer(clock, "filesystem"):
+                    cached = self.writeCached(input, output, item, key)
+                if cached:
+                    self.report(f"Cached {item}")
+                    self.emit(
+                        output, item, "cached", clock, self.matchCount() - before
+                    )
+                    continue
+                self.report(f"Transform {item}")
+                with self.profiling(item):
+                    self.streamMember(input, output, item, clock)
+                with timer(clock, "filesystem"):
+                    self.remember(output, item, key)
+                self.emit(
+                    output, item, "transform", clock, self.matchCount() - before
+                )
+            else:
+                self.report(f"Ignore {item}")
+                with timer(clock, "filesystem"):
+                    self.copyMember(input, output, item)
+                self.emit(
+                    output, item, "ignore", clock, self.matchCount() - before
+                )
+
+    def parallelTransform(
+            self, input: zipfile.ZipFile, output: zipfile.ZipFile,
+    ) -> None:
+        """Decompress, transform and compress matched members in a process
+        pool; write everything in the original order.
+
+        At most 2 * workers members are in flight, which bounds the
+        transformed data held in memory.  Each worker gets one copy
+        without the sinks and opens the archive once; only member names
+        are sent per task.  Their timings come back with the result, but
+        profile() does not reach them.
+        """
+        pending: collections.deque[tuple[
+            zipfile.ZipInfo,
+            "Future[MemberResult] | CacheEntry | None",
+            str | None,
+        ]] = collections.deque()
+        worker = copy.copy(self)
+        worker.sinks = []
+        with ProcessPoolExecutor(
+            self.workers, initializer=_openArchive,
+            initargs=(worker, input.filename),
+        ) as pool:
+            for item in input.infolist():
+                if len(pending) >= 2 * self.workers:
+                    self.writeFinished(input, output, *pending.popleft())
+                if not self.matches(item):
+                    self.report(f"Ignore {item}")
+                    pending.append((item, None, None))
+                    continue
+                key = self.cacheKey(item)
+                if key is not None and (
+                    entry := self.lookup(key, item)
+                ):
+                    self.report(f"Cached {item}")
+                    pending.append((item, entry, key))
+                else:
+                    self.report(f"Transform {item}")
+                    job = pool.submit(transformMember, item.filename)
+                    pending.append((item, job, key))
+            while pending:
+                self.writeFinished(input, output, *pending.popleft())
+
+    def writeFinished(
+            self, input: zipfile.ZipFile, output: zipfile.ZipFile,
+            item: zipfile.ZipInfo,
+            job: "Future[MemberResult] | CacheEntry | None",
+            key: str | None,
+    ) -> None:
+        clock: Counter[str] = Counter()
+        before = self.matchCount()
+        if job is None:
+            with timer(clock, "filesystem"):
+                self.copyMember(input, output, item)
+            self.emit(
+                output, item, "ignore", clock, self.matchCount() - before
+            )
+            return
+        if isinstance(job, CacheEntry):
+            with timer(clock, "filesystem"):
+                self.writeEntry(input, output, item, key, job)  # type: ignore[arg-type]
+            self.emit(
+                output, item, "cached", clock, self.matchCount() - before
+            )
+            return
+        info, data, stats, clock = job.result()
+        self.mergeStats(stats)
+        with timer(clock, "filesystem"):
+            writeRaw(output, info, io.BytesIO(data), len(data))
+            self.remember(output, item, key)
+        self.emit(
+            output, item, "transform", clock, self.matchCount() - before
+        )
+
+    def streamMember(
+            self, input: zipfile.ZipFile, output: zipfile.ZipFile,
+            item: zipfile.ZipInfo, clock: Counter[str] | None = None,
+    ) -> None:
+        """Stream item through transformChunks() into output, adding the
+        time spent to clock; compress includes writing to the file."""
+        clock = Counter() if clock is None else clock
+        self._item = item
+        info = self.targetInfo(input, item)
+        with input.open(item) as source:
+            target = output.open(
+                info, "w",
+                force_zip64=item.file_size >= zipfile.ZIP64_LIMIT // 2,
+            )
+            try:
+                chunks = timed(
+                    iter(lambda: source.read(self.chunkSize), b""),
+                    clock, "decompress",
+                )
+                for chunk in timed(
+                    self.transformChunks(chunks), clock, "transform",
+                    exclude="decompress",
+                ):
+                    with timer(clock, "compress"):
+                        target.write(chunk)
+            finally:
+                with timer(clock, "compress"):
+                    target.close()
+
+    def transformChunks(self, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """Transform a member given as a stream of byte chunks.
+
+        The default spools the member to a temporary file and runs
+        transform() on it, so subclasses that only know about files keep
+        working; override it to transform without touching the disk.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            extracted = Path(directory) / "member"
+            with extracted.open("wb") as target:
+                for chunk in chunks:
+                    target.write(chunk)
+            self.transform(extracted)
+            with extracted.open("rb") as source:
+                yield from iter(lambda: source.read(self.chunkSize), b"")
+
+    def workerStats(self) -> Any:
+        """Whatever a pool worker should send back after a member; taking
+        the stats also resets them."""
+        return None
+
+    def mergeStats(self, stats: Any) -> None:
+        """Fold a worker's workerStats() into this process."""
 
     def matches(self, item: zipfile.ZipInfo) -> bool:
         return (
@@ -57,18 +536,1407 @@ class ZipProcessor(abc.ABC):
         ...
 
 
+#: The output ZipInfo (CRC, sizes and compression filled in), compressed
+#: data, workerStats() and timings of a member transformed by a worker.
+MemberResult = tuple[zipfile.ZipInfo, bytes, Any, Counter[str]]
+
+
+#: Per-process processor and open archive, set up by _openArchive.
+_worker: tuple[ZipProcessor, zipfile.ZipFile] | None = None
+
+
+def _openArchive(processor: ZipProcessor, archive: str) -> None:
+    global _worker
+    processor.workerStats()  # drop counts pickled along from the parent
+    _worker = (processor, zipfile.ZipFile(archive))
+
+
+def transformMember(name: str) -> MemberResult:
+    """Worker side of parallelTransform: returns the member's ZipInfo and
+    transformed data, compressed as processor.targetInfo() says, the
+    processor's workerStats() and the time spent per stage."""
+    assert _worker is not None, "worker has no archive open"
+    processor, input = _worker
+    clock: Counter[str] = Counter()
+    item = input.getinfo(name)
+    processor._item = item
+    info = processor.targetInfo(input, item)
+    compressor = zipfile._get_compressor(
+        info.compress_type, info._compresslevel  # type: ignore[attr-defined]
+    )
+    crc = size = 0
+    parts: list[bytes] = []
+    with input.open(item) as source:
+        chunks = timed(
+            iter(lambda: source.read(processor.chunkSize), b""),
+            clock, "decompress",
+        )
+        for chunk in timed(
+            processor.transformChunks(chunks), clock, "transform",
+            exclude="decompress",
+        ):
+            with timer(clock, "compress"):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                parts.append(compressor.compress(chunk) if compressor else chunk)
+    with timer(clock, "compress"):
+        if compressor:
+            parts.append(compressor.flush())
+        data = b"".join(parts)
+    info.CRC, info.file_size, info.compress_size = crc, size, len(data)
+    if info.compress_type == zipfile.ZIP_LZMA:
+        info.flag_bits |= zipfile._MASK_COMPRESS_OPTION_1
+    return info, data, processor.workerStats(), clock
+
+
+class AsyncPipeline:
+    """The stages of ZipProcessor.processFilesAsync().
+
+    read, transform and write are coroutines joined by two bounded
+    queues, so a full queue holds back the stage feeding it.  All zipfile
+    and transform calls run on a small thread pool of the pipeline's own;
+    with processor.workers > 1, matched members are transformed whole by
+    transformMember in a process pool instead of streamed through a
+    thread.
+
+    The queues carry ("ignore" | "cached" | "start" | "member" | "future",
+    item, extra, payload) headers, payload being the member's clock or,
+    for "future", its transformMember job.  A streamed member follows its
+    "start" as bytes chunks closed by ("end", matches).
+    """
+
+    def __init__(
+            self, processor: ZipProcessor, input: zipfile.ZipFile,
+            rawInput: zipfile.ZipFile, output: zipfile.ZipFile, depth: int = 8,
+    ) -> None:
+        self.processor = processor
+        self.input = input
+        self.rawInput = rawInput
+        self.output = output
+        self.reads: asyncio.Queue[Any] = asyncio.Queue(depth)
+        self.writes: asyncio.Queue[Any] = asyncio.Queue(depth)
+        self.loop: asyncio.AbstractEventLoop
+        self.threads: ThreadPoolExecutor
+        self.processes: ProcessPoolExecutor | None = None
+        self._waiting: set[Future[Any]] = set()
+
+    async def run(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.threads = ThreadPoolExecutor(4, thread_name_prefix="zip-pipeline")
+        if self.processor.workers > 1:
+            worker = copy.copy(self.processor)
+            worker.sinks = []
+            self.processes = ProcessPoolExecutor(
+                self.processor.workers, initializer=_openArchive,
+                initargs=(worker, self.input.filename),
+            )
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(self.read())
+                group.create_task(self.transform())
+                group.create_task(self.write())
+        except BaseExceptionGroup as failure:
+            raise failure.exceptions[0]  # the stage that failed first
+        finally:
+            # Unblock stage threads still waiting on a queue after a failure,
+            for waiting in list(self._waiting):
+                waiting.cancel()
+            # Let them finish (closing any member they were writing)
+            # before the caller closes the archive.
+            await asyncio.to_thread(self.threads.shutdown)
+            if self.processes is not None:
+                self.processes.shutdown(wait=False, cancel_futures=True)
+
+    def call(self, function: Callable[..., Any], *args: Any) -> "asyncio.Future[Any]":
+        return self.loop.run_in_executor(self.threads, function, *args)
+
+    def wait(self, coroutine: Any) -> Any:
+        """Run a queue operation from a stage thread, blocking on it."""
+        waiting = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        self._waiting.add(waiting)
+        try:
+            return waiting.result()
+        finally:
+            self._waiting.discard(waiting)
+
+    def receive(self, clock: Counter[str]) -> Iterator[bytes]:
+        """A streamed member's chunks, for the transform thread; time spent
+        waiting for them goes to clock["wait"]."""
+        while True:
+            with timer(clock, "wait"):
+                chunk = self.wait(self.reads.get())
+            if isinstance(chunk, tuple):
+                return
+            yield chunk
+
+    async def read(self) -> None:
+        processor = self.processor
+        for item in self.input.infolist():
+            clock: Counter[str] = Counter()
+            if not processor.matches(item):
+                processor.report(f"Ignore {item}")
+                await self.reads.put(("ignore", item, None, clock))
+                continue
+            key = processor.cacheKey(item)
+            if key is not None and (
+                entry := await self.call(processor.lookup, key, item)
+            ):
+                processor.report(f"Cached {item}")
+                await self.reads.put(("cached", item, (key, entry), clock))
+                continue
+            processor.report(f"Transform {item}")
+            if self.processes is not None:
+                await self.reads.put(("member", item, key, clock))
+                continue
+            await self.reads.put(("start", item, key, clock))
+            source = await self.call(self.input.open, item)
+            try:
+                while chunk := await self.call(self.readChunk, source, clock):
+                    await self.reads.put(chunk)
+            finally:
+                await self.call(source.close)
+            await self.reads.put(("end", 0))
+        await self.reads.put(None)
+
+    def readChunk(self, source: Any, clock: Counter[str]) -> bytes:
+        with timer(clock, "decompress"):
+            return source.read(self.processor.chunkSize)
+
+    async def transform(self) -> None:
+        while (message := await self.reads.get()) is not None:
+            kind, item, extra, clock = message
+            if kind == "member":
+                job = self.processes.submit(  # type: ignore[union-attr]
+                    transformMember, item.filename
+                )
+                await self.writes.put(("future", item, extra, asyncio.wrap_future(job)))
+            elif kind == "start":
+                await self.writes.put(message)
+                await self.call(self.transformStream, item, clock)
+            else:
+                await self.writes.put(message)
+        await self.writes.put(None)
+
+    def transformStream(self, item: zipfile.ZipInfo, clock: Counter[str]) -> None:
+        processor = self.processor
+        processor._item = item
+        before = processor.matchCount()
+        chunks = self.receive(clock)
+        for chunk in timed(
+            processor.transformChunks(chunks), clock, "transform", exclude="wait",
+        ):
+            self.wait(self.writes.put(chunk))
+        for _ in chunks:
+            pass  # whatever transformChunks left unread
+        self.wait(self.writes.put(("end", processor.matchCount() - before)))
+
+    async def write(self) -> None:
+        while (message := await self.writes.get()) is not None:
+            kind, item, extra, payload = message
+            if kind == "future":
+                result = await payload
+                await self.call(self.writeResult, item, extra, result)
+            elif kind == "start":
+                await self.call(self.writeStream, item, extra, payload)
+            else:
+                await self.call(self.writeCopy, kind, item, extra, payload)
+
+    def writeCopy(
+            self, kind: str, item: zipfile.ZipInfo,
+            extra: "tuple[str, CacheEntry] | None", clock: Counter[str],
+    ) -> None:
+        with timer(clock, "filesystem"):
+            if extra is None:
+                self.processor.copyMember(self.rawInput, self.output, item)
+            else:
+                self.processor.writeEntry(self.rawInput, self.output, item, *extra)
+        self.processor.emit(self.output, item, kind, clock, 0)
+
+    def writeStream(
+            self, item: zipfile.ZipInfo, key: str | None, clock: Counter[str],
+    ) -> None:
+        info = self.processor.targetInfo(self.rawInput, item)
+        target = self.output.open(
+            info, "w", force_zip64=item.file_size >= zipfile.ZIP64_LIMIT // 2
+        )
+        try:
+            while not isinstance(chunk := self.wait(self.writes.get()), tuple):
+                with timer(clock, "compress"):
+                    target.write(chunk)
+            _, matches = chunk
+        finally:
+            with timer(clock, "compress"):
+                target.close()
+        with timer(clock, "filesystem"):
+            self.processor.remember(self.output, item, key)
+        self.processor.emit(self.output, item, "transform", clock, matches)
+
+    def writeResult(
+            self, item: zipfile.ZipInfo, key: str | None, result: MemberResult,
+    ) -> None:
+        processor = self.processor
+        info, data, stats, clock = result
+        before = processor.matchCount()
+        processor.mergeStats(stats)
+        with timer(clock, "filesystem"):
+            writeRaw(self.output, info, io.BytesIO(data), len(data))
+            processor.remember(self.output, item, key)
+        processor.emit(
+            self.output, item, "transform", clock,
+            processor.matchCount() - before,
+        )
+
+
+def outputInfo(item: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    """A fresh ZipInfo carrying over name, date, mode and compression."""
+    info = zipfile.ZipInfo(item.filename, item.date_time)
+    info.compress_type = item.compress_type
+    info.external_attr = item.external_attr
+    info.comment = item.comment
+    return info
+
+
+def sampleMember(
+        input: zipfile.ZipFile, item: zipfile.ZipInfo, size: int,
+) -> bytes:
+    """The first size bytes of item, uncompressed."""
+    with input.open(item) as source:
+        return source.read(size)
+
+
+def seekData(fp, headerOffset: int) -> None:  # binary file object
+    """Position fp at the data following the local header at headerOffset."""
+    fp.seek(headerOffset)
+    header = struct.unpack(
+        zipfile.structFileHeader, fp.read(zipfile.sizeFileHeader)
+    )
+    fp.seek(
+        header[zipfile._FH_FILENAME_LENGTH]
+        + header[zipfile._FH_EXTRA_FIELD_LENGTH],
+        1,
+    )
+
+
+def mappedChunks(source, chunkSize: int) -> Iterator[bytes]:  # binary file
+    """source's contents as chunkSize slices of a read-only mmap.  Pages
+    already handed out are dropped again where the platform allows it,
+    so resident memory does not grow with the file."""
+    if os.fstat(source.fileno()).st_size == 0:
+        return  # an empty file cannot be mapped
+    with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        release = getattr(mmap, "MADV_DONTNEED", None)
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            view.madvise(mmap.MADV_SEQUENTIAL)
+        for offset in range(0, len(view), chunkSize):
+            yield view[offset:offset + chunkSize]
+            if release is not None:
+                page = offset - offset % mmap.PAGESIZE
+                end = min(offset + chunkSize, len(view))
+                view.madvise(release, page, end - page)
+
+
+class CacheEntry(NamedTuple):
+    unchanged: bool
+    crc: int
+    size: int
+    compressSize: int
+    compressType: int
+
+
+class TransformCache:
+    """Transformed members kept between runs in a directory.
+
+    Entries are keyed on the member's name, CRC-32 and size plus the
+    processor's transformKey().  Each holds either a note that the
+    transform left the member as it was, or the compressed bytes it
+    produced, which are copied into the next archive as they are.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, item: zipfile.ZipInfo, transform: str) -> str:
+        identity = f"{item.filename}\0{item.CRC}\0{item.file_size}\0{transform}"
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+    def entryPath(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def data(self, key: str) -> Path:
+        return self.directory / f"{key}.data"
+
+    def get(self, key: str) -> CacheEntry | None:
+        try:
+            return CacheEntry(**json.loads(self.entryPath(key).read_text()))
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+
+    def lookup(
+            self, key: str, item: zipfile.ZipInfo, strict: bool = True,
+    ) -> CacheEntry | None:
+        """get(), counted, and only if it suits the member's compression
+        (unless not strict)."""
+        entry = self.get(key)
+        if entry is not None and not entry.unchanged and (
+            strict and entry.compressType != item.compress_type
+            or not self.data(key).exists()
+        ):
+            entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: CacheEntry, source=None) -> None:
+        """Record entry; source, positioned at the compressed data, is
+        copied for a changed member.  The entry file goes last, so an
+        interrupted put reads as a miss.  Both files are written under a
+        temporary name and renamed, since batch runs share one cache."""
+        if not entry.unchanged:
+            with self.temporary(self.data(key)) as target:
+                remaining = entry.compressSize
+                while remaining:
+                    block = source.read(min(remaining, ZipProcessor.chunkSize))
+                    target.write(block)
+                    remaining -= len(block)
+        with self.temporary(self.entryPath(key)) as target:
+            target.write(json.dumps(entry._asdict()).encode())
+
+    @staticmethod
+    @contextlib.contextmanager
+    def temporary(path: Path) -> Iterator[Any]:
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent, prefix=path.name, suffix=".tmp", delete=False,
+        ) as target:
+            try:
+                yield target
+            except BaseException:
+                target.close()
+                os.unlink(target.name)
+                raise
+        os.replace(target.name, path)
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"Cache: {self.hits} hits, {self.misses} misses ({rate:.0%})"
+
+
+def copyRaw(
+        input: zipfile.ZipFile, output: zipfile.ZipFile, item: zipfile.ZipInfo,
+) -> None:
+    """Copy a member's compressed bytes as they are, without inflating
+    and deflating them again.
+
+    zipfile has no public API for this, so the local header is written
+    here and the entry registered the way ZipFile.write() does it.
+    """
+    seekData(input.fp, item.header_offset)
+    info = zipfile.ZipInfo(item.filename, item.date_time)
+    for name in (
+        "compress_type", "comment", "create_system", "create_version",
+        "extract_version", "flag_bits", "volume", "internal_attr",
+        "external_attr", "CRC", "compress_size", "file_size",
+    ):
+        setattr(info, name, getattr(item, name))
+    # Sizes go in the local header, so no data descriptor follows.
+    info.flag_bits &= ~zipfile._MASK_USE_DATA_DESCRIPTOR
+    info.extra = zipfile._strip_extra(item.extra, (1,))  # old zip64 field
+    writeRaw(output, info, input.fp, item.compress_size)
+
+
+def writeRaw(
+        output: zipfile.ZipFile, info: zipfile.ZipInfo,
+        source, size: int,  # binary file object positioned at the data
+) -> None:
+    with output._lock:
+        output.fp.seek(output.start_dir)
+        info.header_offset = output.fp.tell()
+        output.fp.write(info.FileHeader(zip64=None))
+        remaining = size
+        while remaining:
+            block = source.read(min(remaining, ZipProcessor.chunkSize))
+            if not block:
+                raise zipfile.BadZipFile(f"Truncated member {info.filename}")
+            output.fp.write(block)
+            remaining -= len(block)
+        output.start_dir = output.fp.tell()
+        output.filelist.append(info)
+        output.NameToInfo[info.filename] = info
+        output._didModify = True
+
+
+@contextlib.contextmanager
+def timer(clock: Counter[str], stage: str) -> Iterator[None]:
+    """Add the time spent in the block to clock[stage]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        clock[stage] += time.perf_counter() - start
+
+
+def timed(
+        chunks: Iterable[bytes], clock: Counter[str], stage: str,
+        exclude: str | None = None,
+) -> Iterator[bytes]:
+    """chunks, adding the time taken to produce each one to clock[stage]
+    less whatever clock[exclude] grew by meanwhile (the stage upstream
+    in a generator chain)."""
+    chunks = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        upstream = clock[exclude] if exclude else 0.0
+        chunk = next(chunks, None)
+        clock[stage] += time.perf_counter() - start - (
+            (clock[exclude] if exclude else 0.0) - upstream
+        )
+        if chunk is None:
+            return
+        yield chunk
+
+
+class MemberEvent(NamedTuple):
+    """What happened to one archive member.
+
+    action is "transform", "cached" or "ignore".  bytesIn and bytesOut
+    are compressed sizes, sizeIn and sizeOut uncompressed ones.  The
+    times are seconds: decompress covers reading (and, when extracting,
+    writing out) the member, compress covers compressing and writing it
+    into the new archive, filesystem the rest: raw copies, cache and
+    cleanup.  matches is 0 for processors that do not count them.
+    """
+    archive: str
+    member: str
+    action: str
+    bytesIn: int
+    bytesOut: int
+    sizeIn: int
+    sizeOut: int
+    decompress: float
+    transform: float
+    compress: float
+    filesystem: float
+    matches: int
+
+    @property
+    def ratio(self) -> float:
+        """Compressed over uncompressed size of the member as written."""
+        return self.bytesOut / self.sizeOut if self.sizeOut else 1.0
+
+    @property
+    def seconds(self) -> float:
+        return self.decompress + self.transform + self.compress + self.filesystem
+
+    def asDict(self) -> dict[str, Any]:
+        return self._asdict() | {"ratio": round(self.ratio, 6)}
+
+
+class Sink:
+    """Receives ZipProcessor.instrument() events; both hooks do nothing
+    by default."""
+
+    def event(self, event: MemberEvent) -> None:
+        pass
+
+    def profile(self, archive: str, member: str) -> contextlib.AbstractContextManager[Any]:
+        """Context entered around transforming one member."""
+        return contextlib.nullcontext()
+
+    def collect(self) -> Any:
+        """What a copy of the sink in a worker process gathered, for
+        merge() into the original; None if it keeps nothing."""
+        return None
+
+    def merge(self, collected: Any) -> None:
+        """Fold in what a copy's collect() returned."""
+
+
+class JsonLinesSink(Sink):
+    """Appends each event to a file as a JSON line.
+
+    The file is opened on first use, so copies sent to other processes
+    (BatchProcessor) append to the same file themselves.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._file: Any = None
+        self._lock = threading.Lock()
+
+    def event(self, event: MemberEvent) -> None:
+        line = json.dumps(event.asDict()) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = self.path.open("a", buffering=1)
+            self._file.write(line)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self) -> "JsonLinesSink":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"path": self.path}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__init__(state["path"])  # type: ignore[misc]
+
+
+class Aggregator(Sink):
+    """Totals per archive and per action, and the slowest members."""
+
+    fields = (
+        "bytesIn", "bytesOut", "sizeIn", "sizeOut", "decompress",
+        "transform", "compress", "filesystem", "matches",
+    )
+
+    def __init__(self, slowest: int = 10) -> None:
+        self.archives: collections.defaultdict[str, Counter[str]] = (
+            collections.defaultdict(Counter)
+        )
+        self.actions: collections.defaultdict[str, Counter[str]] = (
+            collections.defaultdict(Counter)
+        )
+        self.slowestCount = slowest
+        self._slowest: list[tuple[float, str, str]] = []
+        self._lock = threading.Lock()
+
+    def event(self, event: MemberEvent) -> None:
+        values = {field: getattr(event, field) for field in self.fields}
+        values["members"] = 1
+        with self._lock:
+            self.archives[event.archive].update(values)
+            self.actions[event.action].update(values)
+            self._rank((event.seconds, event.archive, event.member))
+
+    def _rank(self, entry: tuple[float, str, str]) -> None:
+        if len(self._slowest) < self.slowestCount:
+            heapq.heappush(self._slowest, entry)
+        else:
+            heapq.heappushpop(self._slowest, entry)
+
+    def collect(self) -> Any:
+        return self.archives, self.actions, self._slowest
+
+    def merge(self, collected: Any) -> None:
+        archives, actions, slowest = collected
+        with self._lock:
+            for name, totals in archives.items():
+                self.archives[name].update(totals)
+            for name, totals in actions.items():
+                self.actions[name].update(totals)
+            for entry in slowest:
+                self._rank(entry)
+
+    def slowest(self) -> list[tuple[float, str, str]]:
+        """(seconds, archive, member), slowest first."""
+        return sorted(self._slowest, reverse=True)
+
+    def summary(self) -> str:
+        stages = ("decompress", "transform", "compress", "filesystem")
+        lines = [
+            f"{'':<24} {'members':>8} {'in':>12} {'out':>12} "
+            + " ".join(f"{stage:>10}" for stage in stages) + f" {'matches':>8}"
+        ]
+        for groups in (self.actions, self.archives):
+            for name, totals in sorted(
+                groups.items(), key=lambda group: -sum(group[1][s] for s in stages)
+            ):
+                lines.append(
+                    f"{name[-24:]:<24} {totals['members']:>8} "
+                    f"{totals['bytesIn']:>12} {totals['bytesOut']:>12} "
+                    + " ".join(f"{totals[stage]:>9.3f}s" for stage in stages)
+                    + f" {totals['matches']:>8}"
+                )
+        return "\n".join(lines)
+
+    def __getstate__(self) -> dict[str, Any]:
+        # A copy starts empty, so that merging its collect() back counts
+        # nothing twice.
+        return {"slowest": self.slowestCount}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__init__(state["slowest"])  # type: ignore[misc]
+
+
+class ProfileSink(Sink):
+    """cProfile around each member's transform.
+
+    Profiles are added up in stats and, with a directory, each is also
+    dumped there as <archive>-<member>.prof for pstats or snakeviz.
+    Streamed members are profiled including their decompression and
+    compression, which cannot be told apart from the transform there.
+    """
+
+    def __init__(self, directory: Path | None = None) -> None:
+        self.directory = directory
+        self.stats: pstats.Stats | None = None
+
+    @contextlib.contextmanager
+    def profile(self, archive: str, member: str) -> Iterator[None]:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            if self.directory is not None:
+                name = f"{Path(archive).name}-{member}".replace("/", "_")
+                profiler.dump_stats(self.directory / f"{name}.prof")
+            if self.stats is None:
+                self.stats = pstats.Stats(profiler)
+            else:
+                self.stats.add(profiler)
+
+    def collect(self) -> Any:
+        return None if self.stats is None else self.stats.stats
+
+    def merge(self, collected: Any) -> None:
+        if collected is None:
+            return
+        # Stats() loads from anything with create_stats() and stats.
+        stats = pstats.Stats(
+            types.SimpleNamespace(create_stats=lambda: None, stats=collected)
+        )
+        if self.stats is None:
+            self.stats = stats
+        else:
+            self.stats.add(stats)
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"directory": self.directory, "stats": None}
+
+
+class Compression(NamedTuple):
+    method: int  # zipfile.ZIP_STORED and so on
+    level: int | None = None  # None: the compressor's default
+
+
+class CompressionRule(NamedTuple):
+    """Members matching pattern, of at least minSize bytes uncompressed,
+    are written with method ("keep", "stored", "deflate", "bzip2",
+    "lzma" or "auto") at level."""
+    pattern: str
+    method: str
+    level: int | None = None
+    minSize: int = 0
+
+
+class CompressionPolicy:
+    """Output compression chosen per member; the first matching rule wins
+    and members no rule matches keep the input's compression.
+
+    "auto" deflates the first sampleSize bytes of the member at level 1
+    and stores the member if that saves less than 1 - incompressible of
+    them, or else deflates it at the rule's level.
+    """
+
+    methods = {
+        "stored": zipfile.ZIP_STORED,
+        "deflate": zipfile.ZIP_DEFLATED,
+        "bzip2": zipfile.ZIP_BZIP2,
+        "lzma": zipfile.ZIP_LZMA,
+    }
+    sampleSize = 64 * 1024
+    incompressible = 0.9
+
+    def __init__(self, rules: Iterable[CompressionRule] = ()) -> None:
+        self.rules: list[CompressionRule] = []
+        for rule in rules:
+            self.add(rule)
+
+    @classmethod
+    def media(cls, method: str = "deflate", level: int | None = None) -> "CompressionPolicy":
+        """Audio files (the types audiofile knows) stored, everything
+        else compressed with method."""
+        return cls(
+            [CompressionRule(f"*{audio.ext}", "stored") for audio in AudioFile.__subclasses__()]
+            + [CompressionRule("*", method, level)]
+        )
+
+    def add(self, rule: CompressionRule) -> "CompressionPolicy":
+        if rule.method not in self.methods and rule.method not in ("keep", "auto"):
+            raise ValueError(f"Unknown compression method {rule.method!r}")
+        self.rules.append(rule)
+        return self
+
+    def choose(
+            self, item: zipfile.ZipInfo, sample: Callable[[], bytes],
+    ) -> Compression | None:
+        """How to write item; sample() gives its first bytes for "auto"."""
+        for rule in self.rules:
+            if item.file_size < rule.minSize or not fnmatch.fnmatch(item.filename, rule.pattern):
+                continue
+            if rule.method == "keep":
+                return None
+            if rule.method == "auto":
+                return self.auto(sample(), rule.level)
+            return Compression(self.methods[rule.method], rule.level)
+        return None
+
+    def auto(self, sample: bytes, level: int | None) -> Compression:
+        if not sample or len(zlib.compress(sample, 1)) >= self.incompressible * len(sample):
+            return Compression(zipfile.ZIP_STORED)
+        return Compression(zipfile.ZIP_DEFLATED, level)
+
+    def key(self) -> str:
+        return json.dumps([tuple(rule) for rule in self.rules])
+
+
+class Rule(NamedTuple):
+    pattern: str
+    find: str
+    replace: str
+
+
+class RuleSet:
+    """Many (glob, regex, replacement) rules applied in one pass.
+
+    Each regex is compiled once.  Rules whose find is plain text (and
+    whose replacement has no group references) are merged per glob into
+    a single alternation, longest first; those replacements happen
+    simultaneously, so one literal's output is never re-matched by
+    another.  hits and seconds count matches and time per rule; a
+    merged group's time is booked under its first rule.
+    """
+
+    special = re.compile(r"[.^$*+?{}\[\]\\|()]")
+    #: Constructs that match differently on bytes than on text.
+    unicodeAware = re.compile(r"\.|\[\^|\\[A-Za-z]|\(\?[a-zA-Z]*[iu]")
+
+    def __init__(self, rules: Iterable[Rule] = ()) -> None:
+        self.rules: list[Rule] = []
+        self.hits: Counter[Rule] = Counter()
+        self.seconds: Counter[Rule] = Counter()
+        self._compiled: dict[
+            bool, list[tuple[str, re.Pattern[Any], Any, list[Rule]]]
+        ] = {}
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule: Rule) -> "RuleSet":
+        self.rules.append(rule)
+        self._compiled = {}
+        return self
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def isLiteral(self, rule: Rule) -> bool:
+        return not self.special.search(rule.find) and "\\" not in rule.replace
+
+    def isAscii(self) -> bool:
+        """Whether the rules match the same on ASCII-compatible bytes as
+        on the decoded text.  A find that can match nothing could land
+        inside a multibyte character, so it counts as text-only too."""
+        return all(
+            rule.find.isascii() and rule.replace.isascii()
+            and not self.unicodeAware.search(rule.find)
+            and re.search(rule.find, "") is None
+            for rule in self.rules
+        )
+
+    def compile(
+            self, binary: bool = False,
+    ) -> list[tuple[str, re.Pattern[Any], Any, list[Rule]]]:
+        """(glob, pattern, replacement, rules) in rule order; a merged
+        literal group takes the place of its first rule, its replacement
+        a dict of find -> (rule, replace).  With binary, patterns and
+        replacements are ASCII bytes (see isAscii())."""
+        if binary not in self._compiled:
+            encode = (
+                (lambda text: text.encode("ascii")) if binary
+                else (lambda text: text)
+            )
+            compiled: list[tuple[str, re.Pattern[Any], Any, list[Rule]]] = []
+            literals: dict[str, list[Rule]] = {}
+            for rule in self.rules:
+                if not self.isLiteral(rule):
+                    compiled.append((
+                        rule.pattern, re.compile(encode(rule.find)),
+                        encode(rule.replace), [rule],
+                    ))
+                elif rule.pattern in literals:
+                    literals[rule.pattern].append(rule)
+                else:
+                    literals[rule.pattern] = [rule]
+                    compiled.append((rule.pattern, None, None, literals[rule.pattern]))  # type: ignore[arg-type]
+            for n, (glob, pattern, replace, group) in enumerate(compiled):
+                if pattern is None:
+                    table = {
+                        encode(rule.find): (rule, encode(rule.replace))
+                        for rule in reversed(group)
+                    }
+                    alternation = encode("|").join(
+                        map(re.escape, sorted(table, key=len, reverse=True))
+                    )
+                    compiled[n] = (glob, re.compile(alternation), table, group)
+            self._compiled[binary] = compiled
+        return self._compiled[binary]
+
+    def matches(self, name: str) -> bool:
+        return any(fnmatch.fnmatch(name, rule.pattern) for rule in self.rules)
+
+    def apply(self, name: str, text: str) -> str:
+        for glob, pattern, replace, group in self.compile():
+            if not fnmatch.fnmatch(name, glob):
+                continue
+            start = time.perf_counter()
+            if isinstance(replace, dict):
+                text = pattern.sub(self.replacer(replace, group), text)
+            else:
+                text, count = pattern.subn(replace, text)
+                self.hits[group[0]] += count
+            self.seconds[group[0]] += time.perf_counter() - start
+        return text
+
+    def replacer(self, replace: Any, group: list[Rule]) -> Callable[[re.Match[Any]], Any]:
+        """A re.sub() callable for one compiled entry that counts hits."""
+        if isinstance(replace, dict):
+            def literal(match: re.Match[Any], table: dict[Any, Any] = replace) -> Any:
+                rule, text = table[match.group()]
+                self.hits[rule] += 1
+                return text
+            return literal
+        rule = group[0]
+        def expand(match: re.Match[Any]) -> Any:
+            self.hits[rule] += 1
+            return match.expand(replace)
+        return expand
+
+    def stream(
+            self, name: str, chunks: Iterable[Any], overlap: int,
+            binary: bool = False,
+    ) -> Iterator[Any]:
+        """apply() over a member given as str chunks, or bytes chunks with
+        binary; each compiled entry is one stage of a generator chain."""
+        for glob, pattern, replace, group in self.compile(binary):
+            if fnmatch.fnmatch(name, glob):
+                chunks = self.substituteChunks(
+                    pattern, self.replacer(replace, group), group[0],
+                    chunks, overlap,
+                )
+        return iter(chunks)
+
+    def substituteChunks(
+            self, pattern: re.Pattern[Any], replace: Callable[[re.Match[Any]], Any],
+            rule: Rule, chunks: Iterable[Any], overlap: int,
+    ) -> Iterator[Any]:
+        """pattern.sub(replace) over a stream of chunks.
+
+        Only matches starting more than overlap before the end of the
+        buffered text are replaced, and the last overlap characters
+        already written stay in front of the buffer, so any match no
+        longer than overlap (lookarounds included) comes out as it would
+        on the whole text.  The buffer never holds more than one chunk
+        plus twice overlap.
+        """
+        chunks = iter(chunks)
+        buffer = pattern.pattern[:0]
+        start = 0  # buffer[:start] is written already, kept as context
+        final = False
+        while not final:
+            chunk = next(chunks, None)
+            final = chunk is None
+            if not final:
+                buffer += chunk
+            limit = len(buffer) if final else len(buffer) - overlap
+            if limit <= start:
+                continue
+            clock = time.perf_counter()
+            parts = []
+            position = start
+            for match in pattern.finditer(buffer, start):
+                if not final and match.start() >= limit:
+                    break
+                parts.append(buffer[position:match.start()])
+                parts.append(replace(match))
+                position = match.end()
+            cut = max(position, limit)
+            parts.append(buffer[position:cut])
+            keep = max(cut - overlap, 0)
+            buffer, start = buffer[keep:], cut - keep
+            self.seconds[rule] += time.perf_counter() - clock
+            yield pattern.pattern[:0].join(parts)
+
+    def stats(self) -> tuple[Counter[Rule], Counter[Rule]]:
+        return self.hits, self.seconds
+
+    def merge(self, stats: tuple[Counter[Rule], Counter[Rule]]) -> None:
+        hits, seconds = stats
+        self.hits.update(hits)
+        self.seconds.update(seconds)
+
+    def summary(self) -> str:
+        return "\n".join(
+            f"{rule.pattern} {rule.find!r} -> {rule.replace!r}: "
+            f"{self.hits[rule]} hits, {self.seconds[rule]:.3f}s"
+            for rule in self.rules
+        )
+
+
 class TextTweaker(ZipProcessor):
-    def __init__(self, archive: Path) -> None:
-        super().__init__(archive)
+    encoding = "utf-8"
+    #: Longest match, in characters, found across a chunk boundary.
+    overlap = 64 * 1024
+    #: Encodings where ASCII rules can be matched on the raw bytes.
+    asciiEncodings = frozenset(
+        codecs.lookup(name).name
+        for name in ("ascii", "utf-8", "latin-1", "iso8859-15", "cp1252")
+    )
+
+    def __init__(
+            self, archive: Path, streaming: bool = False, workers: int = 1,
+            cache: "TransformCache | None" = None,
+    ) -> None:
+        super().__init__(archive, streaming, workers, cache)
         self.find: str
         self.replace: str
+        self._single: RuleSet
+        self.rules = RuleSet()
 
     def findAndReplace(self, find: str, replace: str) -> "TextTweaker":
         self.find = find
         self.replace = replace
+        self._single = RuleSet([Rule("*", find, replace)])
+        return self
+
+    def addRule(self, pattern: str, find: str, replace: str) -> "TextTweaker":
+        """Use a rule set instead of the single find/replace pair; all
+        rules are applied in the same pass over the archive."""
+        self.rules.add(Rule(pattern, find, replace))
         return self
 
+    def matches(self, item: zipfile.ZipInfo) -> bool:
+        return super().matches(item) and (
+            not self.rules or self.rules.matches(item.filename)
+        )
+
     def transform(self, extracted: Path) -> None:
-        inputText = extracted.read_text()
-        outputText = re.sub(self.find, self.replace, inputText)
-        extracted.write_text(outputText)
\ No newline at end of file
+        """Rewrite the file through transformChunks(), reading it by mmap
+        rather than as one string."""
+        with extracted.open("rb") as source, tempfile.NamedTemporaryFile(
+            dir=extracted.parent, delete=False
+        ) as target:
+            try:
+                chunks = mappedChunks(source, self.chunkSize)
+                for chunk in self.transformChunks(chunks):
+                    target.write(chunk)
+            except BaseException:
+                target.close()
+                os.unlink(target.name)
+                raise
+        os.replace(target.name, extracted)
+
+    def isBinary(self, rules: RuleSet) -> bool:
+        return (
+            codecs.lookup(self.encoding).name in self.asciiEncodings
+            and rules.isAscii()
+        )
+
+    def transformChunks(self, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """The rules streamed over the member with overlap characters of
+        lookahead (bytes, on the byte path), so memory stays flat and
+        matches straddling two chunks are still replaced.  ASCII rules
+        over an ASCII-compatible encoding skip decoding altogether."""
+        rules = self.ruleSet()
+        name = self._item.filename
+        if self.isBinary(rules):
+            return rules.stream(name, chunks, self.overlap, binary=True)
+        text = codecs.iterdecode(chunks, self.encoding)
+        return codecs.iterencode(
+            rules.stream(name, text, self.overlap), self.encoding
+        )
+
+    def transformKey(self) -> str | None:
+        if self.rules:
+            rules = [tuple(rule) for rule in self.rules.rules]
+        else:
+            rules = [(self.find, self.replace)]
+        return json.dumps(
+            [type(self).__qualname__, self.encoding, self.overlap, rules]
+        )
+
+    def summary(self) -> str:
+        parts = [super().summary(), self.rules.summary() if self.rules else ""]
+        return "\n".join(part for part in parts if part)
+
+    def ruleSet(self) -> RuleSet:
+        """The rules, or the find/replace pair as a rule set of one."""
+        return self.rules or self._single
+
+    def matchCount(self) -> int:
+        return sum(self.ruleSet().hits.values())
+
+    def workerStats(self) -> Any:
+        rules = self.ruleSet()
+        stats = rules.stats()
+        rules.hits, rules.seconds = Counter(), Counter()
+        return stats
+
+    def mergeStats(self, stats: Any) -> None:
+        self.ruleSet().merge(stats)
+
+
+def processArchive(
+        template: ZipProcessor, archive: Path, pattern: str,
+        collect: bool = False,
+) -> dict[str, Any]:
+    """Run one archive through a private copy of template; the copy
+    shares template's sinks.
+
+    In a worker process those sinks are copies themselves; with collect,
+    the result's "sinks" holds their collect() for merging back.
+
+    The copy always streams: copyAndTransform() extracts into the
+    working directory, which concurrent jobs share.
+    """
+    processor = copy.deepcopy(
+        template, {id(sink): sink for sink in template.sinks}
+    )
+    processor.archivePath = archive
+    processor.quiet = True
+    processor.streaming = True
+    start = time.perf_counter()
+    changed = processor.processFiles(pattern)
+    result = {
+        "archive": str(archive),
+        "status": "done" if changed else "unchanged",
+        "seconds": round(time.perf_counter() - start, 6),
+        "summary": processor.summary(),
+    }
+    if collect:
+        result["sinks"] = [sink.collect() for sink in processor.sinks]
+    return result
+
+
+class BatchProcessor:
+    """Runs a configured ZipProcessor over many archives concurrently.
+
+    Archives whose matched members add up to at least cpuBytes of
+    uncompressed data are transform-bound and go to a process pool of
+    workers; the rest mostly copy raw bytes and go to a thread pool of
+    ioWorkers; what the template's sinks gather in a worker process is
+    merged back into them.
+
+    The report gets a JSON line when an archive is started, with its
+    size and mtime, and another when it finishes.  With resume, archives
+    the report lists as finished are skipped; one started but never
+    reported is redone if it still has the size and mtime it started
+    with, and otherwise was rewritten before the interruption and is
+    reported as done.
+    """
+
+    cpuBytes = 1024 * 1024
+
+    def __init__(
+            self,
+            template: ZipProcessor,
+            workers: int = os.cpu_count() or 1,
+            ioWorkers: int | None = None,
+            report: Path | None = None,
+    ) -> None:
+        self.template = template
+        self.workers = workers
+        self.ioWorkers = ioWorkers or 2 * workers
+        self.reportPath = report
+
+    @staticmethod
+    def archives(source: str | Path) -> list[Path]:
+        """A directory (searched recursively for *.zip) or a glob."""
+        if Path(source).is_dir():
+            return sorted(Path(source).rglob("*.zip"))
+        return sorted(Path(p) for p in glob.glob(str(source), recursive=True))
+
+    def progress(self) -> dict[str, dict[str, Any]]:
+        """The report's last entry for each archive."""
+        if self.reportPath is None or not self.reportPath.exists():
+            return {}
+        last = {}
+        with self.reportPath.open() as report:
+            for line in report:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by the interruption
+                last[entry["archive"]] = entry
+        return last
+
+    @staticmethod
+    def recover(archive: Path) -> None:
+        """Finish or drop a rewrite of archive that was interrupted."""
+        pending = archive.with_suffix(f"{archive.suffix}.new")
+        if archive.exists():
+            pending.unlink(missing_ok=True)  # never completed
+        elif pending.exists():
+            # Cut off between makeBackup()'s two renames: pending is
+            # complete and the original is already in .old.
+            pending.replace(archive)
+
+    @staticmethod
+    def identity(archive: Path) -> list[int]:
+        stat = archive.stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def isCpuBound(self, archive: Path, pattern: str) -> bool:
+        processor = copy.copy(self.template)
+        processor._pattern = pattern
+        with zipfile.ZipFile(archive) as input:
+            matched = sum(
+                item.file_size for item in input.infolist()
+                if processor.matches(item)
+            )
+        return matched >= self.cpuBytes
+
+    def run(
+            self, source: str | Path, pattern: str = "*", resume: bool = False,
+    ) -> Iterator[dict[str, Any]]:
+        """Yield one report entry per archive as each one finishes."""
+        progress = self.progress() if resume else {}
+        archives = [
+            a for a in self.archives(source)
+            if progress.get(str(a), {}).get("status") not in ("done", "unchanged")
+        ]
+        with contextlib.ExitStack() as stack:
+            report = (
+                stack.enter_context(self.reportPath.open("a"))
+                if self.reportPath else None
+            )
+            processes = stack.enter_context(ProcessPoolExecutor(self.workers))
+            threads = stack.enter_context(ThreadPoolExecutor(self.ioWorkers))
+            jobs: dict[Future[dict[str, Any]], tuple[Path, str]] = {}
+            for archive in archives:
+                # Report what has finished before queueing more, blocking
+                # once both pools are busy, so that an interruption loses
+                # the report lines of the jobs in flight at most.
+                if jobs:
+                    full = len(jobs) >= self.workers + self.ioWorkers
+                    yield from self.collect(report, jobs, None if full else 0)
+                self.recover(archive)
+                last = progress.get(str(archive), {})
+                try:
+                    if (
+                        last.get("status") == "started"
+                        and self.identity(archive) != last["identity"]
+                    ):
+                        # Rewritten before the interruption: doing it
+                        # again would transform it twice and replace the
+                        # original in .old.
+                        entry = {
+                            "archive": str(archive), "status": "done",
+                            "pool": last["pool"],
+                        }
+                        self.write(report, entry)
+                        yield entry
+                        continue
+                    cpu = self.isCpuBound(archive, pattern)
+                    started = {
+                        "archive": str(archive), "status": "started",
+                        "pool": "cpu" if cpu else "io",
+                        "identity": self.identity(archive),
+                    }
+                except (OSError, zipfile.BadZipFile) as error:
+                    entry = self.failed(archive, "", error)
+                    self.write(report, entry)
+                    yield entry
+                    continue
+                self.write(report, started)
+                pool = processes if cpu else threads
+                job = pool.submit(
+                    processArchive, self.template, archive, pattern, cpu
+                )
+                jobs[job] = (archive, "cpu" if cpu else "io")
+            while jobs:
+                yield from self.collect(report, jobs, None)
+
+    def collect(
+            self, report: Any,
+            jobs: dict["Future[dict[str, Any]]", tuple[Path, str]],
+            timeout: float | None,
+    ) -> Iterator[dict[str, Any]]:
+        """Report and drop the jobs that finish within timeout; None waits
+        for at least one."""
+        done, _ = wait(jobs, timeout, FIRST_COMPLETED)
+        for job in done:
+            archive, kind = jobs.pop(job)
+            try:
+                entry = job.result() | {"pool": kind}
+            except Exception as error:
+                entry = self.failed(archive, kind, error)
+            for sink, collected in zip(
+                self.template.sinks, entry.pop("sinks", ())
+            ):
+                sink.merge(collected)
+            self.write(report, entry)
+            yield entry
+
+    @staticmethod
+    def failed(archive: Path, kind: str, error: BaseException) -> dict[str, Any]:
+        return {
+            "archive": str(archive), "status": "failed", "pool": kind,
+            "error": f"{type(error).__name__}: {error}",
+        }
+
+    @staticmethod
+    def write(report: Any, entry: dict[str, Any]) -> None:
+        if report is not None:
+            entry = {"time": datetime.datetime.now().isoformat()} | entry
+            report.write(json.dumps(entry) + "\n")
+            report.flush()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Find and replace inside the members of many zip archives."
+    )
+    parser.add_argument("source", help="directory of archives, or a glob")
+    parser.add_argument("--pattern", default="*", help="members to transform")
+    parser.add_argument("--find", help="regular expression to replace")
+    parser.add_argument("--replace", default="")
+    parser.add_argument(
+        "--rule", nargs=3, action="append", default=[],
+        metavar=("GLOB", "FIND", "REPLACE"),
+        help="add a rule; may be repeated instead of --find/--replace",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--io-workers", type=int)
+    parser.add_argument(
+        "--overlap", type=int, default=TextTweaker.overlap,
+        help="longest match, in characters, found across chunk boundaries",
+    )
+    parser.add_argument(
+        "--compress", nargs=2, action="append", default=[],
+        metavar=("GLOB", "METHOD[:LEVEL]"),
+        help="output compression for matching members: keep, stored, "
+        "deflate, bzip2, lzma or auto; may be repeated, first match wins",
+    )
+    parser.add_argument("--cache", type=Path, help="TransformCache directory")
+    parser.add_argument("--report", type=Path, help="JSON-lines progress file")
+    parser.add_argument(
+        "--events", type=Path, help="JSON-lines file of per-member events",
+    )
+    parser.add_argument(
+        "--profile", type=Path, help="directory for per-member cProfile dumps",
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="skip archives the report lists as finished",
+    )
+    options = parser.parse_args(argv)
+    if options.find is None and not options.rule:
+        parser.error("give --find or at least one --rule")
+
+    template = TextTweaker(
+        Path(), streaming=True,
+        cache=TransformCache(options.cache) if options.cache else None,
+    )
+    template.overlap = options.overlap
+    if options.compress:
+        policy = CompressionPolicy()
+        for pattern, method in options.compress:
+            method, _, level = method.partition(":")
+            try:
+                policy.add(CompressionRule(pattern, method, int(level) if level else None))
+            except ValueError as error:
+                parser.error(str(error))
+        template.compressWith(policy)
+    if options.events:
+        template.instrument(JsonLinesSink(options.events))
+    if options.profile:
+        options.profile.mkdir(parents=True, exist_ok=True)
+        template.instrument(ProfileSink(options.profile))
+    if options.find is not None:
+        template.findAndReplace(options.find, options.replace)
+    for rule in options.rule:
+        template.addRule(*rule)
+    batch = BatchProcessor(
+        template, options.workers, options.io_workers, options.report
+    )
+    for entry in batch.run(options.source, options.pattern, options.resume):
+        print(json.dumps(entry))
+
+
+def benchmark(
+        directory: Path, members: int = 1_000, size: int = 100_000,
+        workers: int = os.cpu_count() or 1,
+) -> None:
+    """Extract-to-disk against streaming, serial and parallel, on a
+    generated archive.
+
+    The 10 GB / 100k member run is benchmark(path, 100_000, 100_000).
+    """
+    line = b"plover xyzzy lorem ipsum dolor sit amet\n"
+    body = line * (size // len(line))
+    for streaming, workers in ((False, 1), (True, 1), (True, workers)):
+        archive = directory / f"benchmark-{streaming}-{workers}.zip"
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as target:
+            for n in range(members):
+                suffix = "md" if n % 2 else "bin"
+                target.writestr(f"member/{n}.{suffix}", body)
+        tweaker = TextTweaker(archive, streaming, workers).findAndReplace(
+            "xyzzy", "plover's egg"
+        )
+        start = time.perf_counter()
+        tweaker.processFiles("*.md")
+        seconds = time.perf_counter() - start
+        mode = "extract" if not streaming else f"{workers} worker(s)"
+        print(f"{mode}: {seconds:.2f}s for {members} members of {size} bytes")
+        archive.unlink()
+        archive.with_suffix(".zip.old").unlink()
+
+
+def benchmarkCompression(directory: Path, members: int = 20, size: int = 1_000_000) -> None:
+    """Output size and time per compression policy on an archive of
+    text, near-incompressible .mp3 and mixed members."""
+    text = b"plover xyzzy lorem ipsum dolor sit amet, consectetur\n"
+    random = os.urandom(size)
+    source = directory / "compression-source.zip"
+    with zipfile.ZipFile(source, "w", zipfile.ZIP_DEFLATED) as target:
+        for n in range(members):
+            target.writestr(f"text/{n}.md", text * (size // len(text)))
+            target.writestr(f"audio/{n}.mp3", random)
+            target.writestr(f"data/{n}.bin", random[: size // 2] + text * (size // 2 // len(text)))
+    policies: dict[str, CompressionPolicy | None] = {
+        "keep": None,
+        "stored": CompressionPolicy([CompressionRule("*", "stored")]),
+        "deflate 1": CompressionPolicy([CompressionRule("*", "deflate", 1)]),
+        "deflate 6": CompressionPolicy([CompressionRule("*", "deflate", 6)]),
+        "deflate 9": CompressionPolicy([CompressionRule("*", "deflate", 9)]),
+        "bzip2 9": CompressionPolicy([CompressionRule("*", "bzip2", 9)]),
+        "lzma": CompressionPolicy([CompressionRule("*", "lzma")]),
+        "media + deflate 6": CompressionPolicy.media("deflate", 6),
+        "auto": CompressionPolicy([CompressionRule("*", "auto", 6)]),
+    }
+    print(f"{'policy':<20} {'seconds':>8} {'bytes':>12}")
+    for name, policy in policies.items():
+        archive = directory / "compression.zip"
+        archive.write_bytes(source.read_bytes())
+        tweaker = TextTweaker(archive, streaming=True).findAndReplace(
+            "xyzzy", "plover's egg"
+        )
+        tweaker.quiet = True
+        if policy is not None:
+            tweaker.compressWith(policy)
+        start = time.perf_counter()
+        tweaker.processFiles("*.md")
+        seconds = time.perf_counter() - start
+        print(f"{name:<20} {seconds:>8.2f} {archive.stat().st_size:>12}")
+        archive.unlink()
+        archive.with_suffix(".zip.old").unlink()
+    source.unlink()
+
+
+if __name__ == "__main__":
+    main()
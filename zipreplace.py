@@ -1,8 +1,8 @@
-import fnmatch
 from pathlib import Path
-import re
 import zipfile
 
+from zipprocessor import Rule, RuleSet
+
 
 class ZipReplace:
     def __init__(
@@ -11,11 +11,19 @@ class ZipReplace:
         pattern: str,
         find: str,
         replace: str,
+        rules: RuleSet | None = None,
     ) -> None:
         self.archivePath = archive
         self.pattern = pattern
         self.find = find
         self.replace = replace
+        self.rules = rules or RuleSet([Rule(pattern, find, replace)])
+
+    def findAndReplace(self) -> None:
+        inputPath, outputPath = self.makeBackup()
+        with zipfile.ZipFile(outputPath, "w") as output:
+            with zipfile.ZipFile(inputPath) as input:
+                self.copyAndTransform(input, output)
 
     def makeBackup(self) -> tuple[Path, Path]:
         inputPath = self.archivePath.with_suffix(
@@ -30,10 +38,10 @@ class ZipReplace:
         for item in input.infolist():
             extracted = Path(input.extract(item))
             if (not item.is_dir()
-                    and fnmatch.fnmatch(item.filename, self.pattern)):
+                    and self.rules.matches(item.filename)):
                 print(f"Transform {item}")
                 inputText = extracted.read_text()
-                outputText = re.sub(self.find, self.replace, inputText)
+                outputText = self.rules.apply(item.filename, inputText)
                 extracted.write_text(outputText)
             else:
                 print(f"Ignore {item}")
@@ -47,6 +55,6 @@ class ZipReplace:
 
 
 if __name__ == "__main__":
-    sampleZip = Path("sample.zip")
-    zr = ZipReplace(sampleZip, "*.md", "xyzzy", "plover's egg")
-    zr.findAndReplace()
\ No newline at end of file
+    # Batch CLI: python zipreplace.py SOURCE --pattern "*.md" --find ...
+    import zipprocessor
+    zipprocessor.main()
\ No newline at end of file